@@ -1,5 +1,9 @@
 import inspect
+import threading
+import time
 import traceback
+import uuid
+from logging import getLogger
 from pathlib import Path
 
 import dash
@@ -8,31 +12,55 @@ import dash_core_components as dcc
 import dash_dangerously_set_inner_html
 import dash_html_components as html
 import networkx as nx
-import numpy as np
-import pandas as pd
-import plotly.express as px
 from dash import Dash
-from dash.dependencies import ALL, Input, Output, State
+from dash.dependencies import ALL, MATCH, Input, Output, State
+from dash.exceptions import PreventUpdate
 from dash_interactive_graphviz import DashInteractiveGraphviz
 from dash_split_pane import DashSplitPane
 from dash_treebeard import DashTreebeard
 from fn_graph.calculation import (
     NodeInstruction,
     calculate_collect_exceptions,
-    get_execution_instructions,
 )
 from fn_graph.profiler import Profiler
 from fn_graph import Composer
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import PythonLexer
 
-from .parameter_editor import parameter_widgets
-from .result_renderers import add_default_renderers
+from .parameter_editor import (
+    PARAMETER_MODIFIED_FUNCTION,
+    PARAMETER_STATE_FUNCTION,
+    parameter_values,
+    parameter_widgets,
+    widget_values,
+)
+from .background import BackgroundEvaluations
+from .cache_inspection import (
+    CacheUsage,
+    cache_entries,
+    nodes_over_budget,
+    select_nodes,
+)
+from .cache_state import CacheStateIndex
+from .definitions import DefinitionCache
+from .figure_rendering import FigureRenderPool
+from .lru_cache import LRUCache
+from .query import QueryEngine
+from .scenarios import calculate_scenarios, dataframe_diff, differing_parameters
+from .result_renderers import (
+    RenderContext,
+    add_default_renderers,
+    format_bytes,
+    render_context,
+    render_dataframe_summary,
+)
 from .layout_helpers import Pane, VStack, HStack, Fill, Scroll
+from .metrics import Metrics, install_metrics_endpoints, instrumented_callbacks
+from .tracing import Tracer, chain_callbacks, install_tracing
+from .warming import Warming, warm_nodes
 
 __package__ = "fn_graph_studio"
 
+log = getLogger(__name__)
+
 
 # Load up embedded styles
 # We embed the styles directly in the template for portabilities sake
@@ -54,13 +82,68 @@ class BaseStudio:
         show_profiler=True,
         editable_parameters=True,
         renderers=None,
+        metrics=None,
+        tracer=None,
+        figure_processes=0,
+        figure_format="auto",
+        figure_dpi=100,
+        figure_complexity_threshold=50_000,
+        plotly_max_points=5000,
+        stash_size=64,
+        result_cache_size=16,
+        preview_rows=100_000,
+        preview_sample_rows=10_000,
+        warm_on_start=False,
+        warm_workers=4,
+        admin_tools=True,
     ):
         self._get_composer = get_composer
+        # The cache panel and the metrics and diagnostics pages
+        self.admin_tools = admin_tools
         self.show_profiler = show_profiler
         self.editable_parameters = editable_parameters
+        self.renderers = add_default_renderers(renderers)
+        self.figure_pool = FigureRenderPool(processes=figure_processes)
+        self.figure_format = figure_format
+        self.figure_dpi = figure_dpi
+        self.figure_complexity_threshold = figure_complexity_threshold
+        self.plotly_max_points = plotly_max_points
+        # Full resolution data behind interactive results, e.g. decimated figures
+        self.stash = LRUCache(maxsize=stash_size)
+        self.preview_cache = LRUCache(maxsize=stash_size)
+        # Raw node results per session and selection, so that editing the
+        # result processor does not recalculate the node
+        self.result_cache = LRUCache(maxsize=result_cache_size)
+        self.processor_cache = LRUCache(maxsize=256)
+        # Outputs of each stage of the result processor, keyed by the input
+        # result and the stages up to and including it
+        self.stage_cache = LRUCache(maxsize=result_cache_size * 4)
+        # DataFrames longer than preview_rows are processed on a sample first,
+        # and in full in the background
+        self.preview_rows = preview_rows
+        self.preview_sample_rows = preview_sample_rows
+        self.background = BackgroundEvaluations()
+        # Highlighted definitions, warmed in the background for each composer
+        self.definitions = DefinitionCache()
+        self.warmed_composers = LRUCache(maxsize=16)
+        # Composers with the parameters of recent parameter states applied
+        self.updated_composers = LRUCache(maxsize=64)
+        # Which nodes are cached, for the graph's cache overlay
+        self.cache_state = CacheStateIndex()
+        # Hits and ages of cache entries, and sizes of in memory ones, for the
+        # cache panel
+        self.cache_usage = CacheUsage()
+        self.cache_sizes = LRUCache(maxsize=1024)
+        self.warm_workers = warm_workers
+        self.warming = None
+        self.warming_session = None
+        self.warming_lock = threading.Lock()
+        self.metrics = metrics or Metrics()
+        self.tracer = tracer or Tracer()
         app.title = title
 
-        app.layout = self.layout()
+        # A function, so that every page load gets its own session id
+        app.layout = self.layout
 
         app.index_string = (
             """
@@ -91,7 +174,18 @@ class BaseStudio:
         """
         )
 
-        @app.callback(
+        if warm_on_start:
+            # Best effort, a composer that cannot be warmed still gets a studio
+            try:
+                self.start_warming(self.get_composer("/"))
+            except ValueError as e:
+                log.warning("Not warming the cache on start: %s", e)
+
+        install_metrics_endpoints(app.server, self.metrics, endpoints=admin_tools)
+        install_tracing(app.server, self.tracer)
+        callback = instrumented_callbacks(app, self.metrics, self.tracer)
+
+        @callback(
             [
                 Output("result-function-name", "children"),
                 Output("result-type", "children"),
@@ -104,43 +198,259 @@ class BaseStudio:
                 Input("result-processor", "value"),
                 Input("result-or-definition", "value"),
                 Input("invalidate-cache", "n_clicks"),
+                Input("figure-format", "value"),
+                Input("scenario-selection", "value"),
                 Input("url", "pathname"),
-                Input({"type": "parameter", "key": ALL}, "value"),
+                Input("parameter-state", "data"),
+            ],
+            [
+                State("cache-invalidation-store", "data"),
+                State("session-id", "data"),
+                State("scenario-store", "data"),
             ],
-            [State("cache-invalidation-store", "data")],
         )
         def populate_result_with_composer(
             function_name,
             result_processor,
             result_or_definition,
             invalidate_cache_clicks,
+            figure_format,
+            scenario_selection,
             path,
-            parameter_values,
+            parameter_state,
             cache_invalidation_store,
+            session_id,
+            scenario_store,
         ):
             composer = self.get_composer(path)
-            parameters = {
-                input["id"]["key"]: input["value"]
-                for input in dash.callback_context.inputs_list[-1]
-            }
+            parameters = parameter_values(parameter_state)
 
             invalidate_cache = (cache_invalidation_store or 0) < (
                 invalidate_cache_clicks or 0
             )
             if invalidate_cache:
-                composer.cache_invalidate(function_name)
+                self.invalidate_cache(composer, [function_name])
                 cache_invalidation_store = invalidate_cache_clicks
 
             return self.populate_result_pane(
                 composer,
-                add_default_renderers(renderers),
+                self.renderers,
                 parameters,
                 function_name,
                 result_processor,
                 result_or_definition,
+                render_options=dict(figure_format=figure_format),
+                session_id=session_id,
+                scenarios={
+                    name: (scenario_store or {})[name]
+                    for name in scenario_selection or []
+                    if name in (scenario_store or {})
+                },
             ) + (cache_invalidation_store,)
 
-        @app.callback(
+        @callback(
+            Output("scenario-store", "data"),
+            [Input("scenario-save", "n_clicks"), Input("scenario-remove", "n_clicks")],
+            [
+                State("scenario-name", "value"),
+                State("scenario-selection", "value"),
+                State("scenario-store", "data"),
+                State("parameter-state", "data"),
+            ],
+        )
+        def save_scenarios(
+            save_clicks, remove_clicks, name, selection, store, parameter_state
+        ):
+            changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
+            store = dict(store or {})
+            if changed_id == "scenario-save.n_clicks" and (name or "").strip():
+                store[name.strip()] = parameter_values(parameter_state)
+            elif changed_id == "scenario-remove.n_clicks":
+                for name in selection or []:
+                    store.pop(name, None)
+            else:
+                raise PreventUpdate
+            return store
+
+        @callback(
+            [
+                Output("scenario-selection", "options"),
+                Output("scenario-selection", "value"),
+            ],
+            [Input("scenario-store", "data")],
+            [
+                State("scenario-selection", "options"),
+                State("scenario-selection", "value"),
+            ],
+        )
+        def list_scenarios(store, options, selection):
+            store = store or {}
+            known = {option["value"] for option in options or []}
+            # Newly saved scenarios are selected for comparison
+            selection = [name for name in selection or [] if name in store] + [
+                name for name in store if name not in known and options is not None
+            ]
+            return [dict(label=name, value=name) for name in store], selection
+
+        @callback(
+            Output({"type": "decimated-figure", "token": MATCH}, "figure"),
+            [Input({"type": "decimated-figure", "token": MATCH}, "relayoutData")],
+            [State({"type": "decimated-figure", "token": MATCH}, "id")],
+        )
+        def refine_decimated_figure(relayout_data, graph_id):
+            decimated = self.stash.get(graph_id["token"])
+            if decimated is None or not relayout_data:
+                raise PreventUpdate
+
+            with self.metrics.timer("stage_seconds", stage="decimation"):
+                figure = decimated.render_for_relayout(relayout_data)
+            if figure is None:
+                raise PreventUpdate
+            return figure
+
+        @callback(
+            [
+                Output({"type": "object-text", "token": MATCH}, "children"),
+                Output({"type": "object-summary", "token": MATCH}, "children"),
+                Output({"type": "object-more", "token": MATCH}, "style"),
+            ],
+            [Input({"type": "object-more", "token": MATCH}, "n_clicks")],
+            [State({"type": "object-more", "token": MATCH}, "id")],
+        )
+        def load_more_of_object(n_clicks, button_id):
+            pages = self.stash.get(button_id["token"])
+            if pages is None or not n_clicks:
+                raise PreventUpdate
+
+            text = pages.text(n_clicks + 1)
+            summary = pages.summary(n_clicks + 1)
+            if summary is None:
+                return text, "", dict(display="none")
+            return text, summary, dict(marginLeft="0.5rem")
+
+        @callback(
+            Output({"type": "array-table", "token": MATCH}, "data"),
+            [Input({"type": "array-table", "token": MATCH}, "page_current")],
+            [State({"type": "array-table", "token": MATCH}, "id")],
+        )
+        def page_array_table(page_current, table_id):
+            from .ndarray_rendering import table_page
+
+            array = self.stash.get(table_id["token"])
+            if array is None or page_current is None:
+                raise PreventUpdate
+
+            _, records = table_page(array, page_current)
+            return records
+
+        @callback(
+            Output({"type": "lazy-frame-detail", "token": MATCH}, "children"),
+            [
+                Input({"type": "lazy-frame-count", "token": MATCH}, "n_clicks"),
+                Input({"type": "lazy-frame-load", "token": MATCH}, "n_clicks"),
+            ],
+            [State({"type": "lazy-frame-count", "token": MATCH}, "id")],
+        )
+        def materialise_lazy_frame(count_clicks, load_clicks, button_id):
+            from .lazy_frames import count_rows, materialise
+
+            result = self.stash.get(button_id["token"])
+            triggered = dash.callback_context.triggered[0]
+            if result is None or not triggered["value"]:
+                raise PreventUpdate
+
+            if "lazy-frame-count" in triggered["prop_id"]:
+                with self.metrics.timer("stage_seconds", stage="materialise"):
+                    rows = count_rows(result)
+                return html.Div(f"Exactly {rows:,} rows", style=dict(padding="0.5rem"))
+
+            with self.metrics.timer("stage_seconds", stage="materialise"):
+                frame = materialise(result)
+            return Pane(
+                self.render_result(self.renderers, frame),
+                style=dict(height="600px"),
+            )
+
+        @callback(
+            [
+                Output({"type": "dataframe-table-holder", "token": MATCH}, "style"),
+                Output({"type": "dataframe-summary-holder", "token": MATCH}, "style"),
+                Output({"type": "dataframe-summary", "token": MATCH}, "children"),
+            ],
+            [Input({"type": "dataframe-view", "token": MATCH}, "value")],
+            [State({"type": "dataframe-view", "token": MATCH}, "id")],
+        )
+        def switch_dataframe_view(view, selector_id):
+            from .dataframe_summary import profile_dataframe
+
+            frame = self.stash.get(selector_id["token"])
+            if frame is None:
+                raise PreventUpdate
+
+            shown = dict(flexGrow=1, flexShrink=1)
+            hidden = dict(shown, display="none")
+            if view != "summary":
+                return shown, hidden, dash.no_update
+
+            with self.metrics.timer("stage_seconds", stage="profile"):
+                profile = self.preview_cache.get_for_object(
+                    frame, profile_dataframe, name="profile"
+                )
+            return hidden, shown, render_dataframe_summary(profile)
+
+        @callback(
+            [
+                Output({"type": "processed-result", "token": MATCH}, "children"),
+                Output({"type": "processed-result-poll", "token": MATCH}, "disabled"),
+            ],
+            [Input({"type": "processed-result-poll", "token": MATCH}, "n_intervals")],
+            [
+                State({"type": "processed-result-poll", "token": MATCH}, "id"),
+                State("session-id", "data"),
+            ],
+        )
+        def replace_preview(n_intervals, poll_id, session_id):
+            # Kept per session rather than in the stash, which other sessions'
+            # renders could evict it from before the first poll
+            evaluation = self.background.latest(session_id)
+            if evaluation is not None and evaluation.token != poll_id["token"]:
+                # Superseded by a later evaluation
+                return dash.no_update, True
+            if evaluation is None:
+                # e.g. the studio restarted
+                return (
+                    html.Div(
+                        "The full result is no longer being processed, "
+                        "show the result again to process it",
+                        style=dict(padding="0.5rem", color="grey"),
+                    ),
+                    True,
+                )
+
+            renderers, render_options = evaluation.data
+            evaluation.start()
+            if not evaluation.done():
+                raise PreventUpdate
+
+            # Delivered now, so the full result need not be kept any longer
+            self.background.discard(evaluation)
+            try:
+                result = evaluation.result()
+            except Exception as e:
+                return (
+                    html.Div(
+                        [html.Strong("Result processor error: "), html.Span(str(e))],
+                        style=dict(padding="0.5rem", color="red"),
+                    ),
+                    True,
+                )
+
+            context = self.render_context(**(render_options or {}))
+            with self.metrics.timer("stage_seconds", stage="render"):
+                rendered = self.render_result(renderers, result, context)
+            return Pane(rendered, style=dict(height="100%")), True
+
+        @callback(
             Output("graphviz-viewer", "dot_source"),
             [
                 Input("node-name-filter", "value"),
@@ -149,7 +459,7 @@ class BaseStudio:
                 Input("graph-neighbourhood-size", "value"),
                 Input("function-tree", "selected"),
                 Input("url", "pathname"),
-                Input({"type": "parameter", "key": ALL}, "value"),
+                Input("parameter-state", "data"),
             ],
             [State("cache-invalidation-store", "data")],
         )
@@ -160,18 +470,14 @@ class BaseStudio:
             graph_neighbourhood_size,
             selected_node,
             url,
-            parameter_values,
+            parameter_state,
             cache_invalidation_store,
         ):
             composer = self.get_composer(url)
-            parameters = {
-                input["id"]["key"]: input["value"]
-                for input in dash.callback_context.inputs_list[-1]
-            }
 
             return self.populate_graph(
                 composer,
-                parameters,
+                parameter_values(parameter_state),
                 node_name_filter,
                 graph_display_options,
                 graph_neighbourhood,
@@ -179,68 +485,68 @@ class BaseStudio:
                 selected_node,
             )
 
-        @app.callback(
+        @callback(
             Output("function-tree", "data"),
             [Input("node-name-filter", "value"), Input("url", "pathname")],
         )
         def populate_tree_with_composer(node_name_filter, url):
             composer = self.get_composer(url)
-            if node_name_filter:
-                matching_nodes = [
-                    key
-                    for key in composer.functions().keys()
-                    if node_name_filter.strip().lower() in key.lower()
-                ]
-                tree = composer.subgraph(matching_nodes)._build_name_tree()
-            else:
-                tree = composer._build_name_tree()
-
-            def format_tree(key, value):
-                if isinstance(value, str):
-                    return {"name": key, "key": value}
-                else:
-                    return {
-                        "name": key,
-                        "key": key,
-                        "children": [format_tree(k, v) for k, v in value.items()],
-                    }
-
-            return format_tree("_root_", tree)
-
-        @app.callback(
-            Output("parameters-widgets", "children"),
+            with self.metrics.timer("stage_seconds", stage="tree"):
+                return self.populate_tree(composer, node_name_filter)
+
+        @callback(
+            [
+                Output("parameters-widgets", "children"),
+                Output("parameter-defaults", "data"),
+            ],
             [
                 Input("url", "pathname"),
                 Input("parameter-reset-button", "n_clicks"),
-                Input({"type": "parameter", "key": ALL}, "value"),
             ],
-            [State("parameter_store", "data")],
+            # Only read when the page loads or is reset, editing a parameter
+            # changes the state without rebuilding every widget
+            [State("parameter-state", "data")],
         )
-        def populate_parameters_with_composer(
-            url, reset_button, parameter_value_placeholder, store
-        ):
+        def populate_parameters_with_composer(url, reset_button, parameter_state):
             changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
             composer = self.get_composer(url)
 
             if "parameter-reset-button" in changed_id:
                 # We want to reset all the values
-                parameter_values = {}
-                store = {}
-            else:
-                parameter_values = {
-                    input["id"]["key"]: input["value"]
-                    for input in dash.callback_context.inputs_list[-1]
-                }
+                parameter_state = None
+
+            with self.metrics.timer("stage_seconds", stage="parameter_widgets"):
+                return (
+                    parameter_widgets(
+                        composer.parameters(),
+                        parameter_values(parameter_state),
+                        self.editable_parameters,
+                    ),
+                    widget_values(composer.parameters()),
+                )
 
-            return parameter_widgets(
-                composer.parameters(),
-                parameter_values or store or {},
-                self.editable_parameters,
-            )
+        # The browser sends the parameters that differ from their defaults as
+        # a single store, rather than every parameter to every callback
+        app.clientside_callback(
+            PARAMETER_STATE_FUNCTION,
+            Output("parameter-state", "data"),
+            [Input({"type": "parameter", "key": ALL}, "value")],
+            [State("parameter-defaults", "data"), State("parameter-state", "data")],
+        )
+
+        app.clientside_callback(
+            PARAMETER_MODIFIED_FUNCTION,
+            [
+                Output({"type": "parameter-label", "key": MATCH}, "style"),
+                Output({"type": "parameter-modified", "key": MATCH}, "style"),
+            ],
+            [Input({"type": "parameter", "key": MATCH}, "value")],
+            [State("parameter-defaults", "data")],
+        )
 
         sidebar_components = self.sidebar_components()
 
-        @app.callback(
+        @callback(
             [Output(component.id, "style") for component in sidebar_components.values()]
             + [Output("node-name-filter", "style")],
             [Input("explorer-selector", "value")],
@@ -264,25 +570,120 @@ class BaseStudio:
                 )
             ]
 
-        @app.callback(
-            Output("parameter_store", "data"),
-            [
-                Input("url", "pathname"),
-                Input({"type": "parameter", "key": ALL}, "value"),
-            ],
-        )
-        def save_parameters_to_session(url, parameter_values):
-            composer = self.get_composer(url)
-            composer_parameters = composer.parameters()
-            changed_parameters = {
-                input["id"]["key"]: input["value"]
-                for input in dash.callback_context.inputs_list[-1]
-                if input["value"] != composer_parameters[input["id"]["key"]]
-            }
+        # The cache panel lets anyone invalidate or warm every node, so it
+        # is only there for trusted users
+        if self.admin_tools:
+
+            @callback(
+                [Output("cache-entries", "data"), Output("cache-status", "children")],
+                [
+                    Input("explorer-selector", "value"),
+                    Input("cache-refresh", "n_clicks"),
+                    Input("cache-invalidate", "n_clicks"),
+                    Input("node-name-filter", "value"),
+                    Input("cache-warm-poll", "n_intervals"),
+                ],
+                [
+                    State("url", "pathname"),
+                    State("cache-invalidate-mode", "value"),
+                    State("cache-namespace", "value"),
+                    State("cache-budget", "value"),
+                    State("function-tree", "selected"),
+                    State("cache-entries", "selected_row_ids"),
+                ],
+            )
+            def populate_cache_panel_with_composer(
+                explorer,
+                refresh_clicks,
+                invalidate_clicks,
+                node_name_filter,
+                warm_intervals,
+                path,
+                mode,
+                namespace,
+                budget,
+                selected,
+                checked,
+            ):
+                if explorer != "cache":
+                    raise PreventUpdate
+
+                changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
+                if selected and isinstance(selected, list):
+                    selected = selected[0]
+
+                return self.populate_cache_panel(
+                    self.get_composer(path),
+                    mode=mode if changed_id == "cache-invalidate.n_clicks" else None,
+                    selected=selected,
+                    namespace=namespace,
+                    budget=budget,
+                    checked=checked,
+                    node_name_filter=node_name_filter,
+                )
+
+            @callback(
+                [
+                    Output("cache-warm-status", "children"),
+                    Output("cache-warm-poll", "disabled"),
+                ],
+                [
+                    Input("cache-warm", "n_clicks"),
+                    Input("cache-warm-poll", "n_intervals"),
+                ],
+                [
+                    State("url", "pathname"),
+                    State("cache-warm-mode", "value"),
+                    State("function-tree", "selected"),
+                    State("parameter-state", "data"),
+                    State("session-id", "data"),
+                ],
+            )
+            def warm_cache(
+                warm_clicks,
+                warm_intervals,
+                path,
+                mode,
+                selected,
+                parameter_state,
+                session_id,
+            ):
+                changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
+                if changed_id == "cache-warm.n_clicks":
+                    parameters = parameter_values(parameter_state)
+                    if selected and isinstance(selected, list):
+                        selected = selected[0]
+                    if mode != "all" and not selected:
+                        return "Select a node to warm.", True
+
+                    composer = self.update_composer_parameters(
+                        self.get_composer(path), parameters
+                    )
+                    try:
+                        warming = self.start_warming(
+                            composer,
+                            nodes=None if mode == "all" else [selected],
+                            descendants=mode == "descendants",
+                            session_id=session_id,
+                        )
+                    except ValueError as e:
+                        return str(e), True
+                    if warming is None:
+                        return (
+                            "Not started, another warming is running: "
+                            + self.warming.summary(),
+                            True,
+                        )
 
-            return changed_parameters
+                warming = self.warming
+                if warming is None:
+                    return "", True
+                summary = warming.summary()
+                if self.warming_session != session_id:
+                    summary = "Started by another session: " + summary
+                return summary, warming.finished is not None
 
-        @app.callback(
+        @callback(
             Output("tree_store", "data"),
             [Input("function-tree", "selected")],
             [State("tree_store", "data")],
@@ -295,7 +696,7 @@ class BaseStudio:
             data.update({"selected": selected})
             return data
 
-        @app.callback(
+        @callback(
             Output("function-tree", "selected"),
             [Input("graphviz-viewer", "selected"), Input("url", "pathname")],
             [State("tree_store", "data")],
@@ -313,15 +714,40 @@ class BaseStudio:
 
         This allows it to dynamically choose  a composer.
         """
-        return self._get_composer(path)
+        composer = self._get_composer(path)
+        self.warmed_composers.get_for_object(
+            composer, self.warm_definitions, name="definitions"
+        )
+        return composer
+
+    def warm_definitions(self, composer):
+        """
+        Highlights the composer's definitions in the background.
+        """
+        # Keyed by composer, so loading another composer does not cancel
+        # this one's warming
+        key = ("definitions", id(composer))
+
+        def warm():
+            try:
+                self.definitions.warm(composer)
+            finally:
+                self.background.discard(evaluation)
+
+        evaluation = self.background.defer(key, warm)
+        evaluation.start()
+        return evaluation
 
     def layout(self):
         return Pane(
             children=[
                 dcc.Location(id="url", refresh=False),
-                dcc.Store(id="parameter_store", storage_type="session"),
+                dcc.Store(id="session-id", data=uuid.uuid4().hex),
+                dcc.Store(id="parameter-state", storage_type="session"),
+                dcc.Store(id="parameter-defaults", storage_type="memory"),
                 dcc.Store(id="tree_store", storage_type="session"),
                 dcc.Store(id="cache-invalidation-store", storage_type="memory"),
+                dcc.Store(id="scenario-store", storage_type="session"),
                 DashSplitPane(
                     [self.sidebar_layout(), self.results_pane_layout()],
                     size=400,
@@ -402,7 +828,7 @@ class BaseStudio:
         )
 
     def sidebar_components(self):
-        return {
+        components = {
             "graph": Fill(
                 self.function_graph(),
                 id="function-graph-holder",
@@ -420,6 +846,7 @@ class BaseStudio:
                             id="parameters-widgets",
                             style=dict(flexGrow=1, flexShrink=1, overflowY="auto"),
                         ),
+                        self.scenario_editor(),
                         Pane(
                             html.Button(
                                 "Reset parameters", id="parameter-reset-button"
@@ -433,6 +860,214 @@ class BaseStudio:
                 style=dict(display="none"),
             ),
         }
+        if self.admin_tools:
+            components["cache"] = Fill(
+                self.cache_panel(), id="cache-holder", style=dict(display="none")
+            )
+        return components
+
+    def scenario_editor(self):
+        return VStack(
+            [
+                html.Strong("Scenarios"),
+                HStack(
+                    [
+                        dcc.Input(
+                            id="scenario-name",
+                            type="text",
+                            placeholder="Scenario name",
+                            style=dict(flexGrow=1, border="1px solid lightgrey"),
+                        ),
+                        html.Button("Save parameters", id="scenario-save"),
+                    ],
+                    style=dict(marginTop="5px"),
+                ),
+                dcc.Checklist(
+                    id="scenario-selection",
+                    options=[],
+                    value=[],
+                    labelStyle=dict(display="block"),
+                    inputStyle=dict(marginRight=4),
+                    style=dict(marginTop="5px", maxHeight="150px", overflowY="auto"),
+                ),
+                Pane(
+                    html.Button("Remove checked", id="scenario-remove"),
+                    style=dict(marginTop="5px"),
+                ),
+            ],
+            style=dict(
+                padding="0.5rem", borderTop="1px solid lightgrey", flexShrink=0
+            ),
+        )
+
+    def cache_panel(self):
+        import dash_table
+        from dash_table.Format import Format, Scheme, Symbol
+
+        seconds = Format(group=",").symbol(Symbol.yes).symbol_suffix(" s")
+        return VStack(
+            [
+                HStack(
+                    [
+                        dcc.Dropdown(
+                            id="cache-invalidate-mode",
+                            options=[
+                                {"label": "Selected node", "value": "selected"},
+                                {"label": "Ancestors", "value": "ancestors"},
+                                {"label": "Descendants", "value": "descendants"},
+                                {"label": "Namespace", "value": "namespace"},
+                                {"label": "Checked entries", "value": "checked"},
+                                {"label": "Size budget (LRU)", "value": "budget"},
+                            ],
+                            value="descendants",
+                            clearable=False,
+                            searchable=False,
+                            persistence=True,
+                            style=dict(flexGrow=1),
+                        ),
+                        html.Button("Invalidate", id="cache-invalidate"),
+                        html.Button("Refresh", id="cache-refresh"),
+                    ],
+                    style=dict(flexShrink=0, alignItems="center", overflow="visible"),
+                ),
+                HStack(
+                    [
+                        dcc.Input(
+                            id="cache-namespace",
+                            type="text",
+                            placeholder="Namespace",
+                            persistence=True,
+                            style=dict(flexGrow=1, border="1px solid lightgrey"),
+                        ),
+                        dcc.Input(
+                            id="cache-budget",
+                            type="number",
+                            placeholder="Budget MB",
+                            min=0,
+                            persistence=True,
+                            style=dict(width="100px", border="1px solid lightgrey"),
+                        ),
+                    ],
+                    style=dict(flexShrink=0, marginTop="5px"),
+                ),
+                HStack(
+                    [
+                        dcc.Dropdown(
+                            id="cache-warm-mode",
+                            options=[
+                                {"label": "Selected node", "value": "selected"},
+                                {"label": "Descendants", "value": "descendants"},
+                                {"label": "Every node", "value": "all"},
+                            ],
+                            value="selected",
+                            clearable=False,
+                            searchable=False,
+                            persistence=True,
+                            style=dict(flexGrow=1),
+                        ),
+                        html.Button("Warm", id="cache-warm"),
+                    ],
+                    style=dict(
+                        flexShrink=0,
+                        alignItems="center",
+                        overflow="visible",
+                        marginTop="5px",
+                    ),
+                ),
+                html.Div(id="cache-warm-status", style=dict(marginTop="5px")),
+                dcc.Interval(id="cache-warm-poll", interval=1000, disabled=True),
+                html.Div(id="cache-status", style=dict(margin="5px 0")),
+                Pane(
+                    Scroll(
+                        dash_table.DataTable(
+                            id="cache-entries",
+                            columns=[
+                                {"name": "node", "id": "node"},
+                                {
+                                    "name": "size",
+                                    "id": "bytes",
+                                    "type": "numeric",
+                                    "format": Format(
+                                        precision=3, scheme=Scheme.decimal_si_prefix
+                                    ).symbol(Symbol.yes).symbol_suffix("B"),
+                                },
+                                {
+                                    "name": "age",
+                                    "id": "age",
+                                    "type": "numeric",
+                                    "format": seconds,
+                                },
+                                {"name": "hits", "id": "hits", "type": "numeric"},
+                                {
+                                    "name": "idle",
+                                    "id": "idle",
+                                    "type": "numeric",
+                                    "format": seconds,
+                                },
+                            ],
+                            data=[],
+                            sort_action="native",
+                            sort_by=[{"column_id": "bytes", "direction": "desc"}],
+                            row_selectable="multi",
+                            page_size=100,
+                            style_cell=dict(
+                                maxWidth="200px",
+                                overflow="hidden",
+                                textOverflow="ellipsis",
+                            ),
+                        )
+                    ),
+                    style=dict(flexGrow=1, flexShrink=1),
+                ),
+            ],
+            style=dict(
+                height="100%",
+                width="100%",
+                position="absolute",
+                padding="5px",
+            ),
+        )
+
+    def populate_cache_panel(
+        self,
+        composer,
+        mode=None,
+        selected=None,
+        namespace=None,
+        budget=None,
+        checked=None,
+        node_name_filter=None,
+    ):
+        """
+        The cache entries and a status line, invalidating the entries chosen
+        by the mode first if one is given.
+        """
+        status = []
+        if mode == "budget":
+            if budget is None:
+                status.append("Enter a budget to trim the cache to.")
+            else:
+                entries = cache_entries(composer, self.cache_usage, self.cache_sizes)
+                nodes = nodes_over_budget(entries, budget * 1e6)
+                invalidated = self.invalidate_cache(composer, nodes)
+                status.append(f"Invalidated {len(invalidated)} nodes.")
+        elif mode is not None:
+            nodes = select_nodes(
+                composer, mode, selected=selected, namespace=namespace, checked=checked
+            )
+            invalidated = self.invalidate_cache(composer, nodes)
+            status.append(f"Invalidated {len(invalidated)} nodes.")
+
+        entries = cache_entries(composer, self.cache_usage, self.cache_sizes)
+        if node_name_filter:
+            entries = [
+                entry
+                for entry in entries
+                if node_name_filter.strip().lower() in entry["node"].lower()
+            ]
+        total = sum(entry["bytes"] or 0 for entry in entries)
+        status.append(f"{len(entries)} cached nodes, {total / 1e6:,.1f} MB.")
+        return entries, " ".join(status)
 
     def result_processor(self):
         return dash_ace_persistent.DashAceEditor(
@@ -441,7 +1076,7 @@ class BaseStudio:
             theme="github",
             mode="python",
             tabSize=2,
-            placeholder="e.g. result.query(....)",
+            placeholder="e.g. result.query(....)\n---\nresult.groupby(...).sum()\n\nSeparate stages with a line of ---, each stage's result is the next stage's result variable.",
             maxLines=10,
             minLines=5,
             showGutter=False,
@@ -507,6 +1142,7 @@ class BaseStudio:
         ]
         if self.show_profiler:
             options.append({"label": "Profiler", "value": "profiler"})
+        options.append({"label": "Compare", "value": "compare"})
 
         status_bar = html.Div(
             [
@@ -521,6 +1157,20 @@ class BaseStudio:
                 html.Span(
                     [
                         html.Button("Invalidate Cache", id="invalidate-cache"),
+                        html.Strong("Figures:", style=dict(marginLeft="10px")),
+                        dcc.Dropdown(
+                            id="figure-format",
+                            options=[
+                                {"label": "Auto", "value": "auto"},
+                                {"label": "SVG", "value": "svg"},
+                                {"label": "PNG", "value": "png"},
+                            ],
+                            value=self.figure_format,
+                            clearable=False,
+                            searchable=False,
+                            persistence=True,
+                            style=dict(width="80px", marginLeft="2px"),
+                        ),
                         dcc.RadioItems(
                             id="result-or-definition",
                             options=options,
@@ -551,16 +1201,106 @@ class BaseStudio:
         )
 
     def process_result(self, result, result_processor_value):
+        import numpy as np
+        import pandas as pd
+        import plotly.express as px
 
         return eval(
-            result_processor_value, globals(), dict(result=result, px=px, pd=pd, np=np)
+            self.compile_processor(result_processor_value),
+            globals(),
+            dict(result=result, px=px, pd=pd, np=np),
         )
 
-    def render_result(self, renderers, result):
-        for typ, render in renderers:
-            if isinstance(result, typ):
+    def processor_stages(self, result_processor_value):
+        """
+        The stages of the result processor, separated by lines of ---.
+        """
+        stages = [[]]
+        for line in result_processor_value.splitlines():
+            if line.strip() == "---":
+                stages.append([])
+            else:
+                stages[-1].append(line)
+        return ["\n".join(stage) for stage in stages if "".join(stage).strip()]
+
+    def run_processor(self, result, result_processor_value):
+        """
+        Runs each stage of the result processor on the output of the previous
+        one, reusing the cached output of unchanged leading stages.
+        """
+        stages = self.processor_stages(result_processor_value)
+        output = result
+        for index, stage in enumerate(stages):
+
+            def process(_, previous=output, stage=stage):
+                return self.process_result(previous, stage)
+
+            try:
+                output = self.stage_cache.get_for_object(
+                    result, process, name=tuple(stages[: index + 1])
+                )
+            except Exception as e:
+                if len(stages) == 1:
+                    raise
+                raise RuntimeError(f"Stage {index + 1}: {e}") from e
+        return output
+
+    def compile_processor(self, source):
+        """
+        The compiled result processor expression, cached by source text.
+        """
+        code = self.processor_cache.get(source)
+        if code is None:
+            code = compile(source.strip(), "<result processor>", "eval")
+            self.processor_cache.set(source, code)
+        return code
+
+    def render_result(self, renderers, result, context=None):
+        context = context or self.render_context()
+        render = renderers.lookup(type(result))
+        if render is None:
+            return "Rendering error - No matching renderer"
+
+        with self.tracer.span(
+            "render", renderer=render.__name__, result_type=type(result).__name__
+        ) as span:
+            shape = getattr(result, "shape", None)
+            if shape:
+                span.set(rows=shape[0])
+            with render_context(context):
                 return render(result)
-        return "Rendering error - No matching renderer"
+
+    def render_context(self, figure_format=None):
+        """
+        The context made available to the renderers.
+        """
+        return RenderContext(
+            figure_pool=self.figure_pool,
+            figure_format=figure_format or self.figure_format,
+            figure_dpi=self.figure_dpi,
+            figure_complexity_threshold=self.figure_complexity_threshold,
+            plotly_max_points=self.plotly_max_points,
+            stash=self.stash,
+            preview_cache=self.preview_cache,
+        )
+
+    def describe_result(self, result, context, render_seconds):
+        """
+        The result type, along with how long it took to render and how big the
+        rendered output is when the renderer reports it.
+        """
+        details = [f"rendered in {render_seconds:.2f}s"]
+        if "format" in context.stats:
+            details.append(f"as {context.stats['format'].upper()}")
+        if "bytes" in context.stats:
+            details.append(format_bytes(context.stats["bytes"]))
+        if "note" in context.stats:
+            details.append(context.stats["note"])
+
+        return [
+            str(type(result)),
+            html.Span(f" ({', '.join(details)})", style=dict(color="grey")),
+        ]
 
     def render_exception(self, exception_info):
 
@@ -609,26 +1349,35 @@ class BaseStudio:
         )
 
     def populate_result(
-        self, composer, renderers, function_name, result_processor_value, parameters
+        self,
+        composer,
+        renderers,
+        function_name,
+        result_processor_value,
+        parameters,
+        render_options=None,
+        session_id=None,
     ):
 
-        composer = self.update_composer_parameters(composer, parameters)
-
-        results, exception_info = calculate_collect_exceptions(
-            composer, [function_name]
+        result, exception_info = self.calculate_result(
+            composer, function_name, parameters, session_id
         )
 
         if exception_info:
             return (function_name, None, None, self.render_exception(exception_info))
 
-        result = results[function_name]
-
         error = None
+        pending = None
         if result_processor_value.strip():
             try:
-                result = self.process_result(result, result_processor_value)
+                with self.metrics.timer("stage_seconds", stage="processing"):
+                    result, pending = self.process_result_with_preview(
+                        result, result_processor_value, session_id
+                    )
             except Exception as e:
                 error = str(e)
+        else:
+            self.background.cancel(session_id)
 
         error_bar = (
             html.Div(
@@ -644,17 +1393,392 @@ class BaseStudio:
             else None
         )
 
+        context = self.render_context(**(render_options or {}))
+        start = time.perf_counter()
+        with self.metrics.timer("stage_seconds", stage="render"):
+            rendered = self.render_result(renderers, result, context)
+        render_seconds = time.perf_counter() - start
+
+        if pending is not None:
+            evaluation, sample_rows, total_rows = pending
+            evaluation.data = (renderers, render_options)
+            rendered = self.preview_container(
+                evaluation.token, rendered, sample_rows, total_rows
+            )
+
         return (
             function_name,
-            str(type(result)),
+            self.describe_result(result, context, render_seconds),
             error_bar,
-            self.render_result(renderers, result),
+            rendered,
+        )
+
+    def calculate_comparison(self, composer, function_name, scenarios, session_id=None):
+        """
+        The result and exception info of the function for each scenario,
+        reusing the results last calculated for this session and scenarios.
+        """
+        key = (
+            session_id,
+            id(composer),
+            function_name,
+            "scenarios",
+            tuple(
+                (name, tuple(sorted((k, repr(v)) for k, v in parameters.items())))
+                for name, parameters in scenarios.items()
+            ),
+        )
+        if session_id is not None and key in self.result_cache:
+            self.metrics.increment("result_cache_total", outcome="hit")
+            return self.result_cache.get(key)
+
+        with self.metrics.timer("stage_seconds", stage="calculation"):
+            with self.tracer.span("calculation", outputs=function_name):
+                results = calculate_scenarios(
+                    composer,
+                    function_name,
+                    {
+                        name: self.cast_parameters(composer, parameters)
+                        for name, parameters in scenarios.items()
+                    },
+                    progress_callback=self.calculation_callback(composer),
+                )
+
+        if session_id is not None:
+            self.metrics.increment("result_cache_total", outcome="miss")
+            self.result_cache.set(key, results)
+        return results
+
+    def populate_comparison(
+        self,
+        composer,
+        renderers,
+        function_name,
+        result_processor_value,
+        parameters,
+        scenarios,
+        render_options=None,
+        session_id=None,
+    ):
+        """
+        The function's result for the current parameters and each of the
+        scenarios, side by side, or as differences from the current result if
+        they are all DataFrames.
+        """
+        if not scenarios:
+            return (
+                function_name,
+                None,
+                None,
+                html.Div(
+                    "Save and check scenarios in the Parameters tab to compare them "
+                    "with the current parameters.",
+                    style=dict(padding="0.5rem"),
+                ),
+            )
+
+        # Both hold only the parameters that differ from their defaults
+        defaults = widget_values(composer.parameters())
+        scenarios = {
+            "Current": {**defaults, **parameters},
+            **{name: {**defaults, **values} for name, values in scenarios.items()},
+        }
+        results = self.calculate_comparison(
+            composer, function_name, scenarios, session_id
+        )
+        differing = sorted(differing_parameters(scenarios))
+
+        processed = {}
+        for name, (result, exception_info) in results.items():
+            if exception_info:
+                processed[name] = (None, self.render_exception(exception_info))
+                continue
+            try:
+                if result_processor_value.strip():
+                    result = self.run_processor(result, result_processor_value)
+                processed[name] = (result, None)
+            except Exception as e:
+                processed[name] = (None, html.Pre(str(e), style=dict(color="red")))
+
+        def heading(name):
+            values = ", ".join(f"{k}={scenarios[name].get(k)!r}" for k in differing)
+            return html.Div(
+                [html.Strong(name), html.Span(f" {values}" if values else "")],
+                style=dict(padding="0.5rem", borderBottom="1px solid lightgrey"),
+            )
+
+        from pandas import DataFrame
+
+        frames = [result for result, _ in processed.values()]
+        if all(isinstance(frame, DataFrame) for frame in frames):
+            rendered = self.render_dataframe_comparison(processed, heading)
+        else:
+            context = self.render_context(**(render_options or {}))
+            rendered = HStack(
+                [
+                    VStack(
+                        [
+                            heading(name),
+                            Pane(
+                                Scroll(
+                                    error
+                                    if error is not None
+                                    else self.render_result(renderers, result, context)
+                                ),
+                                style=dict(flexGrow=1),
+                            ),
+                        ],
+                        style=dict(
+                            flex="1 1 0",
+                            height="100%",
+                            borderRight="1px solid lightgrey",
+                        ),
+                    )
+                    for name, (result, error) in processed.items()
+                ],
+                style=dict(height="100%"),
+            )
+
+        description = f"Comparing {len(scenarios)} scenarios"
+        if differing:
+            description += f" differing in {', '.join(differing)}"
+        return function_name, description, None, rendered
+
+    def render_dataframe_comparison(self, processed, heading):
+        import dash_table
+
+        names = list(processed)
+        base = processed[names[0]][0]
+        sections = []
+        for name in names[1:]:
+            diff = dataframe_diff(base, processed[name][0])
+            frame = diff["frame"].reset_index()
+            frame.columns = [str(column) for column in frame.columns]
+            summary = (
+                f"{diff['changed_rows']:,} of {diff['rows']:,} rows differ from "
+                f"{names[0]}"
+            )
+            if diff["changed_columns"]:
+                changed = ", ".join(str(c) for c in diff["changed_columns"])
+                summary += f" in {changed}"
+            summary += (
+                f", {diff['added_rows']:,} rows added and "
+                f"{diff['removed_rows']:,} removed."
+            )
+            if len(frame) < diff["changed_rows"]:
+                summary += f" Showing the first {len(frame):,} changed rows."
+            sections.append(
+                html.Div(
+                    [
+                        heading(name),
+                        html.Div(summary, style=dict(padding="0.5rem")),
+                        dash_table.DataTable(
+                            columns=[{"name": c, "id": c} for c in frame.columns],
+                            data=frame.to_dict("records"),
+                            sort_action="native",
+                            page_size=50,
+                        ),
+                    ],
+                    style=dict(marginBottom="1rem"),
+                )
+            )
+        return html.Div(sections)
+
+    def process_result_with_preview(self, result, result_processor_value, session_id):
+        """
+        Processes the result, or for long DataFrames a deterministic sample of
+        it while the full result is processed in the background.
+
+        Returns the processed result and, for a preview, the deferred full
+        evaluation with the sample and full row counts.
+        """
+        from pandas import DataFrame
+
+        if (
+            self.preview_rows is None
+            or not isinstance(result, DataFrame)
+            or len(result) <= self.preview_rows
+        ):
+            self.background.cancel(session_id)
+            return self.run_processor(result, result_processor_value), None
+
+        def sample(result):
+            import numpy as np
+
+            positions = np.sort(
+                np.random.default_rng(0).choice(
+                    len(result), self.preview_sample_rows, replace=False
+                )
+            )
+            return result.iloc[positions]
+
+        # The same sample is reused so its stage outputs can be cached
+        rows = self.stage_cache.get_for_object(result, sample, name="sample")
+        preview = self.run_processor(rows, result_processor_value)
+
+        def process_in_full():
+            with self.metrics.timer("stage_seconds", stage="background_processing"):
+                return self.run_processor(result, result_processor_value)
+
+        # Started by the first poll, once the preview has been sent
+        evaluation = self.background.defer(session_id, process_in_full)
+        return preview, (evaluation, len(rows), len(result))
+
+    def preview_container(self, token, rendered, sample_rows, total_rows):
+        """
+        Wraps a result processed on a sample, with a badge saying so and a
+        poll that swaps in the full result when it is ready.
+        """
+        badge = html.Div(
+            [
+                html.Span(
+                    "Preview",
+                    style=dict(
+                        backgroundColor="orange",
+                        color="white",
+                        borderRadius="3px",
+                        padding="0 4px",
+                        marginRight="0.5rem",
+                    ),
+                ),
+                f"Processed {sample_rows:,} sampled rows of {total_rows:,}, "
+                "the full result will replace this when it is ready",
+            ],
+            style=dict(padding="2px", color="grey"),
+        )
+        return Fill(
+            [
+                VStack(
+                    [
+                        badge,
+                        Pane(rendered, style=dict(flexGrow=1, flexShrink=1)),
+                    ],
+                    id={"type": "processed-result", "token": token},
+                    style=dict(height="100%"),
+                ),
+                dcc.Interval(
+                    id={"type": "processed-result-poll", "token": token},
+                    interval=500,
+                ),
+            ]
         )
 
+    def calculate_result(self, composer, function_name, parameters, session_id=None):
+        """
+        The raw result of the function, reusing the result last calculated
+        for this session, function and parameters.
+
+        Returns the result and the exception info if the calculation failed.
+        """
+        key = (
+            session_id,
+            id(composer),
+            function_name,
+            tuple(sorted((k, repr(v)) for k, v in parameters.items())),
+        )
+        if session_id is not None and key in self.result_cache:
+            self.metrics.increment("result_cache_total", outcome="hit")
+            return self.result_cache.get(key), None
+
+        composer = self.update_composer_parameters(composer, parameters)
+
+        with self.metrics.timer("stage_seconds", stage="calculation"):
+            with self.tracer.span("calculation", outputs=function_name):
+                results, exception_info = calculate_collect_exceptions(
+                    composer,
+                    [function_name],
+                    progress_callback=self.calculation_callback(composer),
+                )
+
+        if exception_info:
+            return None, exception_info
+
+        result = results[function_name]
+        if session_id is not None:
+            self.metrics.increment("result_cache_total", outcome="miss")
+            self.result_cache.set(key, result)
+        return result, None
+
+    def calculation_callback(self, composer, *callbacks):
+        """
+        The progress callback for calculating the composer, keeping the cache
+        state and usage up to date, tracing, and calling any given callbacks.
+        """
+        return chain_callbacks(
+            *callbacks,
+            self.cache_state.calculation_callback(composer),
+            self.cache_usage.calculation_callback(composer),
+            self.tracer.calculation_callback(),
+        )
+
+    def start_warming(self, composer, nodes=None, descendants=False, session_id=None):
+        """
+        Warms the cache for the nodes (every node if None), and their
+        descendants if asked for, on a thread of its own. Only one warming
+        runs at a time, returns None while another is running.
+        """
+        with self.warming_lock:
+            if self.warming is not None and self.warming.finished is None:
+                return None
+            warming = self._start_warming(composer, nodes, descendants)
+            self.warming_session = session_id
+            return warming
+
+    def _start_warming(self, composer, nodes, descendants):
+        warming = Warming(
+            composer,
+            warm_nodes(composer, nodes, descendants=descendants),
+            workers=self.warm_workers,
+            # Not traced, the request that started it has long finished
+            progress_callback=chain_callbacks(
+                self.cache_state.calculation_callback(composer),
+                self.cache_usage.calculation_callback(composer),
+            ),
+        )
+        self.warming = warming
+        # Not on the background pool, a long warming would hold one of its
+        # workers and starve every session's background evaluations
+        threading.Thread(
+            target=warming.run, name="fn_graph_studio_warming", daemon=True
+        ).start()
+        return warming
+
+    def invalidate_cache(self, composer, nodes):
+        """
+        Invalidates the cached results of the nodes and their descendants.
+        """
+        if not nodes:
+            return set()
+        dag = composer.dag()
+        invalidated = set(nodes)
+        for node in nodes:
+            invalidated.update(nx.descendants(dag, node))
+
+        composer.cache_invalidate(*nodes)
+        self.cache_state.invalidate(composer, *nodes)
+        self.cache_usage.forget(composer, invalidated)
+        self.forget_results()
+        return invalidated
+
+    def forget_results(self, session_id=None, composer=None):
+        """
+        Drops the retained results of a session, or of every session, and
+        only those of the composer if given.
+        """
+        for key in self.result_cache.keys():
+            if session_id is not None and key[0] != session_id:
+                continue
+            if composer is not None and key[1] != id(composer):
+                continue
+            self.result_cache.pop(key)
+
     def populate_definition(self, composer, function_name):
 
-        source = composer.get_source(function_name)
-        highlighted = highlight(source, PythonLexer(), HtmlFormatter())
+        with self.metrics.timer("stage_seconds", stage="highlight"):
+            highlighted, cached = self.definitions.get(composer, function_name)
+        self.metrics.increment(
+            "definition_cache_total", outcome="hit" if cached else "miss"
+        )
 
         return (
             function_name,
@@ -671,9 +1795,13 @@ class BaseStudio:
         composer = self.update_composer_parameters(composer, parameters)
 
         profiler = Profiler()
-        calculate_collect_exceptions(
-            composer, [function_name], progress_callback=profiler
-        )
+        with self.metrics.timer("stage_seconds", stage="calculation"):
+            with self.tracer.span("calculation", outputs=function_name):
+                calculate_collect_exceptions(
+                    composer,
+                    [function_name],
+                    progress_callback=self.calculation_callback(composer, profiler),
+                )
 
         profile = profiler.results()
 
@@ -763,6 +1891,9 @@ class BaseStudio:
         function_name,
         result_processor,
         result_or_definition,
+        render_options=None,
+        session_id=None,
+        scenarios=None,
     ):
 
         if function_name not in set(composer.dag().nodes()):
@@ -770,30 +1901,85 @@ class BaseStudio:
 
         if result_or_definition == "result":
             return self.populate_result(
-                composer, renderers, function_name, result_processor, parameters
+                composer,
+                renderers,
+                function_name,
+                result_processor,
+                parameters,
+                render_options,
+                session_id,
             )
         elif result_or_definition == "definition":
             return self.populate_definition(composer, function_name)
+        elif result_or_definition == "compare":
+            return self.populate_comparison(
+                composer,
+                renderers,
+                function_name,
+                result_processor,
+                parameters,
+                scenarios or {},
+                render_options,
+                session_id,
+            )
         else:
             return self.populate_profiler(composer, function_name, parameters)
 
     def update_composer_parameters(self, composer, parameters):
         """
         Ensures that boolean parameters get cast correctly
+
+        The updated composer is kept per composer and parameter values, so the
+        callbacks fired by one edit share it.
         """
+        key = tuple(sorted((k, repr(v)) for k, v in parameters.items()))
+        with self.tracer.span("update_composer_parameters"):
+            return self.updated_composers.get_for_object(
+                composer,
+                lambda composer: self._update_composer_parameters(
+                    composer, parameters
+                ),
+                name=("parameters", key),
+            )
+
+    def _update_composer_parameters(self, composer, parameters):
+        return composer.update_parameters(**self.cast_parameters(composer, parameters))
 
+    def cast_parameters(self, composer, parameters):
         def smartish_cast(type_, value):
             if issubclass(type_, bool) and isinstance(value, str):
                 return value.lower()[0] == "t"
             else:
                 return value
 
-        parameters = {
+        return {
             key: smartish_cast(type_, parameters[key])
             for key, (type_, _) in composer.parameters().items()
             if key in parameters
         }
-        return composer.update_parameters(**parameters)
+
+    def populate_tree(self, composer, node_name_filter):
+        if node_name_filter:
+            matching_nodes = [
+                key
+                for key in composer.functions().keys()
+                if node_name_filter.strip().lower() in key.lower()
+            ]
+            tree = composer.subgraph(matching_nodes)._build_name_tree()
+        else:
+            tree = composer._build_name_tree()
+
+        def format_tree(key, value):
+            if isinstance(value, str):
+                return {"name": key, "key": value}
+            else:
+                return {
+                    "name": key,
+                    "key": key,
+                    "children": [format_tree(k, v) for k, v in value.items()],
+                }
+
+        return format_tree("_root_", tree)
 
     def populate_graph(
         self,
@@ -857,7 +2043,8 @@ class BaseStudio:
             }
 
         if caching:
-            instructions = get_execution_instructions(composer, composer.dag(), [])
+            with self.metrics.timer("stage_seconds", stage="cache_state"):
+                instructions = self.cache_state.instructions(composer, G)
 
             def get_node_styles(instruction):
                 return {
@@ -867,19 +2054,21 @@ class BaseStudio:
                 }[instruction]
 
             extra_node_styles = {
-                node: get_node_styles(instruction) for node, instruction in instructions
+                node: get_node_styles(instruction)
+                for node, instruction in instructions.items()
             }
         else:
             extra_node_styles = {}
 
-        return composer.graphviz(
-            hide_parameters=hide_parameters,
-            flatten=flatten,
-            expand_links=expand_links,
-            highlight=[selected_node],
-            filter=subgraph,
-            extra_node_styles=extra_node_styles,
-        ).source
+        with self.metrics.timer("stage_seconds", stage="graphviz"):
+            return composer.graphviz(
+                hide_parameters=hide_parameters,
+                flatten=flatten,
+                expand_links=expand_links,
+                highlight=[selected_node],
+                filter=subgraph,
+                extra_node_styles=extra_node_styles,
+            ).source
 
 
 class Studio(BaseStudio):
@@ -892,8 +2081,28 @@ class ExternalStudio(BaseStudio):
     It does not allow for code injection (We think).
 
     Use with Caution, this is a WIP.
+
+    Query results are cached per result and query string. query_engine is
+    passed to pandas ("auto" picks numexpr when it is installed), and
+    query_indexes lists columns to answer equality and range conditions on
+    from sorted indexes.
     """
 
+    def __init__(
+        self,
+        app,
+        *,
+        query_engine="auto",
+        query_indexes=None,
+        query_cache_size=64,
+        **kwargs,
+    ):
+        kwargs.setdefault("admin_tools", False)
+        self.query_engine = QueryEngine(
+            engine=query_engine, indexes=query_indexes, cache_size=query_cache_size
+        )
+        super().__init__(app, **kwargs)
+
     def result_processor(self):
         return dash_ace_persistent.DashAceEditor(
             id="result-processor",
@@ -901,7 +2110,7 @@ class ExternalStudio(BaseStudio):
             theme="github",
             mode="python",
             tabSize=2,
-            placeholder='Enter a query string.\n\nYou can use full pandas query strings.\ne.g.: merchant_id == "ABC"',
+            placeholder='Enter a query string.\n\nYou can use full pandas query strings.\ne.g.: merchant_id == "ABC"\n\nSeparate successive queries with a line of ---.',
             maxLines=10,
             minLines=5,
             showGutter=False,
@@ -914,11 +2123,69 @@ class ExternalStudio(BaseStudio):
         from pandas import DataFrame
 
         if isinstance(result, DataFrame):
-            return result.query(value, truediv=True)
+            return self.query_engine.query(result, value)
         else:
             return result
 
 
+class SnapshotStudio(ExternalStudio):
+    """
+    Serves a snapshot exported by `fn_graph_studio.snapshot.export_snapshot`
+    without calculating anything. Results are shown as they were rendered when
+    exported, unless they are queried or shown in another figure format, in
+    which case the exported data is read and rendered.
+    """
+
+    def __init__(self, app, *, snapshot, **kwargs):
+        self.snapshot = snapshot
+        composer = snapshot.composer()
+        kwargs.setdefault("figure_format", snapshot.manifest["figure_format"])
+        kwargs.setdefault("show_profiler", False)
+        kwargs.setdefault("editable_parameters", False)
+        super().__init__(app, get_composer=lambda path: composer, **kwargs)
+
+    def populate_result(
+        self,
+        composer,
+        renderers,
+        function_name,
+        result_processor_value,
+        parameters,
+        render_options=None,
+        session_id=None,
+    ):
+        rendered = self.snapshot.rendered(function_name)
+        figure_format = (render_options or {}).get("figure_format")
+        if (
+            rendered is None
+            or result_processor_value.strip()
+            or figure_format not in (None, self.snapshot.manifest["figure_format"])
+        ):
+            self.metrics.increment("snapshot_results_total", how="rendered")
+            return super().populate_result(
+                composer,
+                renderers,
+                function_name,
+                result_processor_value,
+                parameters,
+                render_options,
+                session_id,
+            )
+
+        self.metrics.increment("snapshot_results_total", how="prerendered")
+        entry = self.snapshot.nodes[function_name]
+        details = ["pre-rendered"]
+        if "format" in entry["stats"]:
+            details.append(f"as {entry['stats']['format'].upper()}")
+        if "bytes" in entry["stats"]:
+            details.append(format_bytes(entry["stats"]["bytes"]))
+        description = [
+            entry["type"],
+            html.Span(f" ({', '.join(details)})", style=dict(color="grey")),
+        ]
+        return function_name, description, None, rendered
+
+
 def run_external_studio(composer, **kwargs):
     """
     Run an external studio for the given composer.
@@ -933,10 +2200,58 @@ def run_studio(composer, **kwargs):
     _run_studio(Studio, composer, **kwargs)
 
 
+def run_snapshot_studio(directory, **kwargs):
+    """
+    Run a studio serving the snapshot exported to the directory.
+    """
+    from .snapshot import Snapshot
+
+    app = Dash(__name__, suppress_callback_exceptions=True)
+    SnapshotStudio(app, snapshot=Snapshot(directory), **kwargs)
+    app.run_server(debug=False, threaded=True)
+
+
+def run_registry_studio(
+    composers, *, cls=Studio, memory_budget=None, idle_seconds=None, **kwargs
+):
+    """
+    Run a studio serving many composers, each under a URL prefix.
+
+    composers maps prefixes to composers, or to 'path.to.module:obj' specs
+    imported on first request, see `fn_graph_studio.registry`. The studio is
+    run without the reloader, evicted composers are imported afresh instead.
+    """
+    from .registry import ComposerRegistry
+
+    registry = ComposerRegistry(
+        composers, memory_budget=memory_budget, idle_seconds=idle_seconds
+    )
+    app, studio = _studio_app(cls, registry, **kwargs)
+    registry.on_evict = lambda prefix, composer: studio.forget_results(
+        composer=composer
+    )
+    app.run_server(debug=False, threaded=True)
+
+
 def _run_studio(cls, composer, **kwargs):
     """
     Run a studio of type cls for the given composer.
     """
-    app = Dash(__name__, suppress_callback_exceptions=True)
-    cls(app, get_composer=lambda path: composer, **kwargs)
+    app, _ = _studio_app(cls, lambda path: composer, **kwargs)
     app.run_server(debug=True)
+
+
+def _studio_app(cls, get_composer, record_session=None, **kwargs):
+    """
+    A Dash app and a studio of type cls on it.
+
+    If record_session is a path, every callback payload is recorded to it for
+    later replay by the load tester.
+    """
+    app = Dash(__name__, suppress_callback_exceptions=True)
+    studio = cls(app, get_composer=get_composer, **kwargs)
+    if record_session:
+        from .loadtest import install_session_recorder
+
+        install_session_recorder(app.server, record_session)
+    return app, studio
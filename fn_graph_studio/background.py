@@ -0,0 +1,113 @@
+"""
+Evaluations that run after the callback has returned.
+
+Each evaluation belongs to a key (e.g. a session) and a new evaluation for a
+key supersedes the previous one. Evaluations are deferred until they are
+started, so a preview can be sent to the browser before the full evaluation
+competes with it for the GIL. Superseded evaluations that have not started
+are cancelled. Python cannot interrupt a running thread, so one that has
+already started runs to completion, but its result is never used.
+"""
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .lru_cache import LRUCache
+
+
+class Evaluation:
+    def __init__(self, owner, key, fn, data=None):
+        self._owner = owner
+        self.key = key
+        self.fn = fn
+        # Whatever the caller needs to use the result, e.g. how to render it
+        self.data = data
+        self.token = secrets.token_hex(16)
+        self.future = None
+
+    def start(self):
+        """
+        Starts the evaluation, unless it has started or been superseded.
+        """
+        self._owner._start(self)
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+
+
+class BackgroundEvaluations:
+    """
+    The latest evaluation of up to max_keys keys, an evaluation evicted before
+    it started never runs.
+    """
+
+    def __init__(self, workers=2, max_keys=64):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="fn_graph_studio_background"
+        )
+        # Evaluations hold their inputs and results until they are discarded
+        # or superseded, e.g. by a session that never polls again
+        self._latest = LRUCache(maxsize=max_keys)
+        self._lock = threading.Lock()
+
+    def defer(self, key, fn, data=None):
+        """
+        An evaluation of fn() for the key, to be started later, superseding
+        the previous evaluation for the key.
+        """
+        evaluation = Evaluation(self, key, fn, data)
+        with self._lock:
+            previous = self._latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._latest.set(key, evaluation)
+        return evaluation
+
+    def _start(self, evaluation):
+        with self._lock:
+            if evaluation.future is None and self._is_current(evaluation):
+                evaluation.future = self._executor.submit(evaluation.fn)
+
+    def cancel(self, key):
+        """
+        Cancels the latest evaluation for the key, if there is one.
+        """
+        with self._lock:
+            previous = self._latest.pop(key, None)
+            if previous is not None:
+                previous.cancel()
+
+    def discard(self, evaluation):
+        """
+        Forgets the evaluation, if it is still the latest for its key.
+        """
+        with self._lock:
+            if self._is_current(evaluation):
+                self._latest.pop(evaluation.key)
+
+    def latest(self, key):
+        """
+        The latest evaluation for the key, None if it has none.
+        """
+        with self._lock:
+            return self._latest.get(key)
+
+    def _is_current(self, evaluation):
+        return self._latest.get(evaluation.key) is evaluation
+
+    def is_current(self, evaluation):
+        """
+        Whether the evaluation is the latest for its key.
+        """
+        with self._lock:
+            return self._is_current(evaluation)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
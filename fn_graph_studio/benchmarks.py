@@ -0,0 +1,258 @@
+"""
+Benchmarks of the studio against synthetic composers.
+
+The synthetic composers have a configurable shape (node count, depth, fan-out,
+namespace nesting and parameter count) and a set of result nodes returning
+DataFrames, figures and large objects of a configurable size. Each benchmark
+calls the studio's methods and renderers directly, so the report measures the
+server side work without any browser or network in the way.
+"""
+
+import inspect
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime
+
+from fn_graph import Composer
+
+try:
+    from importlib.metadata import version
+except ImportError:  # Python 3.7
+    version = None
+
+
+def signature(names):
+    return inspect.Signature(
+        [
+            inspect.Parameter(name, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+            for name in names
+        ]
+    )
+
+
+def _node_function(predecessors, weight):
+    def node(*args):
+        return sum(args) + weight
+
+    node.__signature__ = signature(predecessors)
+    return node
+
+
+def synthetic_composer(
+    nodes=100,
+    depth=10,
+    fan_out=2,
+    namespace_depth=2,
+    parameters=10,
+    result_size=10_000,
+    seed=0,
+):
+    """
+    Builds a layered composer.
+
+    The nodes are split over `depth` layers, every node feeds into `fan_out`
+    nodes in the next layer, and the first layer reads from the parameters.
+    Nodes are nested `namespace_depth` namespaces deep.
+
+    Result nodes (`result_dataframe`, `result_plotly`, `result_matplotlib`,
+    `result_networkx` and `result_object`) read from the last layer and
+    return results with roughly `result_size` rows or points.
+    """
+    rng = random.Random(seed)
+    depth = max(1, min(depth, nodes))
+
+    def namespaced(index):
+        namespace = [
+            f"ns_{(index >> (2 * level)) % 4}" for level in range(namespace_depth)
+        ]
+        return "__".join([*namespace, f"node_{index}"])
+
+    parameter_names = [f"parameter_{i}" for i in range(parameters)]
+    layers = [[] for _ in range(depth)]
+    for index in range(nodes):
+        layers[index * depth // nodes].append(namespaced(index))
+
+    predecessors = {name: set() for layer in layers for name in layer}
+    for name in layers[0]:
+        predecessors[name].update(
+            rng.sample(parameter_names, min(fan_out, len(parameter_names)))
+        )
+    for upstream, downstream in zip(layers, layers[1:]):
+        for name in upstream:
+            for target in rng.sample(downstream, min(fan_out, len(downstream))):
+                predecessors[target].add(name)
+        for name in downstream:
+            if not predecessors[name]:
+                predecessors[name].add(rng.choice(upstream))
+
+    functions = {
+        name: _node_function(sorted(preds), rng.random())
+        for name, preds in predecessors.items()
+    }
+
+    source = layers[-1][0]
+
+    def result_dataframe(*args):
+        import numpy as np
+        import pandas as pd
+
+        values = np.random.default_rng(seed).normal(size=(result_size, 10))
+        return pd.DataFrame(values, columns=[f"column_{i}" for i in range(10)])
+
+    def result_plotly(result_dataframe):
+        import plotly.express as px
+
+        return px.line(result_dataframe.reset_index(), x="index", y="column_0")
+
+    def result_matplotlib(result_dataframe):
+        import matplotlib.figure
+
+        figure = matplotlib.figure.Figure()
+        figure.add_subplot().plot(result_dataframe.index, result_dataframe.column_0)
+        return figure
+
+    def result_networkx(*args):
+        import networkx as nx
+
+        return nx.gnm_random_graph(min(result_size, 150), min(result_size, 300), seed)
+
+    def result_object(*args):
+        return {
+            f"key_{i}": dict(index=i, values=list(range(10)))
+            for i in range(result_size)
+        }
+
+    for fn in [result_dataframe, result_networkx, result_object]:
+        fn.__signature__ = signature([source])
+
+    return (
+        Composer()
+        .update(**functions)
+        .update(
+            result_dataframe=result_dataframe,
+            result_plotly=result_plotly,
+            result_matplotlib=result_matplotlib,
+            result_networkx=result_networkx,
+            result_object=result_object,
+        )
+        .update_parameters(**{name: (int, i) for i, name in enumerate(parameter_names)})
+    )
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return dict(
+        min=min(timings),
+        median=statistics.median(timings),
+        mean=statistics.mean(timings),
+        max=max(timings),
+        repeat=repeat,
+    )
+
+
+def studio_benchmarks(studio, composer, renderers):
+    """
+    The benchmarks to run, as a dictionary of name to zero argument callable.
+    """
+    from .parameter_editor import parameter_widgets
+
+    selected = sorted(composer.dag().nodes())[len(composer.dag()) // 2]
+    results = composer.calculate(
+        [
+            "result_dataframe",
+            "result_plotly",
+            "result_matplotlib",
+            "result_networkx",
+            "result_object",
+        ]
+    )
+
+    def graph(options):
+        return lambda: studio.populate_graph(
+            composer, {}, "", options, ["all"], 1, selected
+        )
+
+    def populate_result(name):
+        return lambda: studio.populate_result(composer, renderers, name, "", {})
+
+    benchmarks = {
+        "populate_graph": graph(["parameters"]),
+        "populate_graph_caching": graph(["parameters", "caching"]),
+        "populate_tree": lambda: studio.populate_tree(composer, ""),
+        "populate_tree_filtered": lambda: studio.populate_tree(composer, "node_1"),
+        "parameter_widgets": lambda: parameter_widgets(composer.parameters(), {}, True),
+        "populate_profiler": lambda: studio.populate_profiler(
+            composer, "result_object", {}
+        ),
+        "populate_definition": lambda: studio.populate_definition(composer, selected),
+    }
+
+    for name in results:
+        benchmarks[f"populate_result:{name}"] = populate_result(name)
+
+    for name, result in results.items():
+        benchmarks[f"render:{name}"] = lambda result=result: studio.render_result(
+            renderers, result
+        )
+
+    return benchmarks
+
+
+def run_benchmarks(repeat=5, query_rows=1_000_000, **composer_options):
+    """
+    Runs every benchmark and returns a JSON serializable report.
+
+    The external studio's queries are benchmarked on a frame of query_rows
+    rows, or skipped if it is 0.
+    """
+    from dash import Dash
+
+    from . import BaseStudio
+    from .query import benchmark_queries
+    from .result_renderers import add_default_renderers
+    from .tracing import Tracer
+
+    composer = synthetic_composer(**composer_options)
+    app = Dash(__name__, suppress_callback_exceptions=True)
+    studio = BaseStudio(
+        app, get_composer=lambda path: composer, tracer=Tracer(directory=None)
+    )
+    renderers = add_default_renderers(None)
+
+    try:
+        package_version = version("fn_graph_studio") if version else None
+    except Exception:
+        package_version = None
+
+    return dict(
+        timestamp=datetime.now().isoformat(),
+        version=package_version,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        composer=dict(
+            composer_options,
+            functions=len(composer.functions()),
+            edges=composer.dag().number_of_edges(),
+        ),
+        benchmarks={
+            name: time_call(fn, repeat)
+            for name, fn in studio_benchmarks(studio, composer, renderers).items()
+        },
+        queries=benchmark_queries(query_rows, repeat) if query_rows else None,
+    )
+
+
+def write_report(report, path=None):
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
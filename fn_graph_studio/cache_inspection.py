@@ -0,0 +1,168 @@
+"""
+What is in a composer's cache: an entry per cached node with its size, age and
+hit count, and the selection of entries to invalidate in bulk.
+
+Sizes come from the backend where it can tell cheaply: the files of the
+development cache, and an estimate of the values held by in memory caches.
+Hit counts, and the ages of entries of in memory caches, are only known for
+calculations made by the studio since it started.
+"""
+import sys
+import threading
+import time
+
+import networkx as nx
+
+from .lru_cache import LRUCache
+
+
+class CacheUsage:
+    """
+    When each node was stored and retrieved, per cache backend, recorded from
+    calculation progress events.
+    """
+
+    def __init__(self, maxsize=16):
+        self._usage = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def usage(self, composer):
+        return self._usage.get_for_object(
+            composer._cache, lambda cache: {}, name="cache_usage"
+        )
+
+    def _record(self, composer, node, event):
+        usage = self.usage(composer)
+        now = time.time()
+        with self._lock:
+            entry = usage.setdefault(node, dict(stored=None, hits=0, last_used=None))
+            if event == "stored":
+                entry.update(stored=now, last_used=now)
+            else:
+                entry["hits"] += 1
+                entry["last_used"] = now
+
+    def forget(self, composer, nodes):
+        usage = self.usage(composer)
+        with self._lock:
+            for node in nodes:
+                usage.pop(node, None)
+
+    def calculation_callback(self, composer):
+        def callback(event_type, details):
+            if event_type == "end_cache_store":
+                self._record(composer, details["name"], "stored")
+            elif event_type == "end_cache_retrieval":
+                self._record(composer, details["name"], "hit")
+
+        return callback
+
+
+def value_size(value):
+    """
+    An estimate of the bytes a value takes in memory.
+    """
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage) and hasattr(value, "columns"):
+        return int(memory_usage(index=True, deep=True).sum())
+    if callable(memory_usage):
+        return int(memory_usage(index=True, deep=True))
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+def _disk_entry(cache, node):
+    paths = [
+        cache.cache_root / f"{node}.data",
+        cache.cache_root / f"{node}.info.json",
+        cache.cache_root / f"{node}.fn.hash",
+    ]
+    stats = [path.stat() for path in paths if path.exists()]
+    if not stats or not paths[0].exists():
+        return None
+    return sum(stat.st_size for stat in stats), max(stat.st_mtime for stat in stats)
+
+
+def cache_entries(composer, usage, size_cache=None):
+    """
+    A dictionary per cached node of its name, namespace, size in bytes, age
+    in seconds, hit count and seconds since it was last used.
+
+    size_cache, an LRUCache, keeps the estimated sizes of in memory values.
+    """
+    cache = composer._cache
+    usage = usage.usage(composer)
+    now = time.time()
+
+    found = {}
+    if hasattr(cache, "cache_root"):
+        for node in composer._functions:
+            entry = _disk_entry(cache, node)
+            if entry is not None:
+                found[node] = entry
+    elif isinstance(getattr(cache, "cache", None), dict):
+        for node, value in list(cache.cache.items()):
+            if size_cache is None:
+                size = value_size(value)
+            else:
+                size = size_cache.get_for_object(value, value_size, name="size")
+            stored = usage.get(node, {}).get("stored")
+            found[node] = size, stored
+
+    entries = []
+    for node, (size, stored) in found.items():
+        node_usage = usage.get(node, {})
+        last_used = node_usage.get("last_used") or stored
+        entries.append(
+            dict(
+                id=node,
+                node=node,
+                namespace="__".join(node.split("__")[:-1]),
+                bytes=size,
+                age=round(now - stored) if stored else None,
+                hits=node_usage.get("hits", 0),
+                idle=round(now - last_used) if last_used else None,
+            )
+        )
+    return entries
+
+
+def nodes_over_budget(entries, budget_bytes):
+    """
+    The nodes to invalidate to bring the entries within budget_bytes, least
+    recently used first.
+    """
+    total = sum(entry["bytes"] or 0 for entry in entries)
+    evicted = []
+    # Entries never used by the studio count as the least recently used
+    for entry in sorted(
+        entries, key=lambda e: -(float("inf") if e["idle"] is None else e["idle"])
+    ):
+        if total <= budget_bytes:
+            break
+        evicted.append(entry["node"])
+        total -= entry["bytes"] or 0
+    return evicted
+
+
+def select_nodes(composer, mode, selected=None, namespace=None, checked=None):
+    """
+    The nodes to invalidate for a bulk invalidation mode.
+    """
+    dag = composer.dag()
+    if mode == "selected":
+        return [selected] if selected in dag else []
+    if mode == "ancestors":
+        return [selected, *nx.ancestors(dag, selected)] if selected in dag else []
+    if mode == "descendants":
+        return [selected, *nx.descendants(dag, selected)] if selected in dag else []
+    if mode == "namespace":
+        prefix = (namespace or "").strip().strip("_")
+        if not prefix:
+            return []
+        return [node for node in dag if node.startswith(prefix + "__")]
+    if mode == "checked":
+        return [node for node in checked or [] if node in dag]
+    raise ValueError(f"Unknown invalidation mode {mode!r}")
@@ -0,0 +1,126 @@
+"""
+An in memory index of which nodes the composer's cache holds valid results for.
+
+Asking a cache backend whether a node is valid can be expensive, the
+development cache reads and hashes files on disk for every node. The index
+remembers each answer together with a fingerprint of what it was asked about:
+the function object for functions, and the value for parameters. The backend
+is only asked again when the fingerprint changes, e.g. a parameter is edited or
+a module is reloaded. Calculations and invalidations made through the studio
+update the index as they happen. Changes made to a cache outside the studio
+are not seen until the index is cleared.
+"""
+import threading
+
+import networkx as nx
+from fn_graph.calculation import NodeInstruction
+
+from .lru_cache import LRUCache
+
+_BY_VALUE = (bool, int, float, str, bytes, type(None))
+
+
+def fingerprint(composer, node):
+    if node in composer._parameters:
+        value = composer._parameters[node][1]
+        if isinstance(value, _BY_VALUE):
+            return ("value", type(value), value)
+        return ("id", id(value))
+    return ("id", id(composer._functions[node]))
+
+
+class CacheStateIndex:
+    def __init__(self, maxsize=16):
+        # Node validity per cache backend, composers with updated parameters
+        # share their original's backend
+        self._states = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.probes = 0
+
+    def _state(self, composer):
+        return self._states.get_for_object(
+            composer._cache, lambda cache: {}, name="cache_state"
+        )
+
+    def _valid(self, composer, state, node):
+        key = fingerprint(composer, node)
+        entry = state.get(node)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        valid = composer._cache.valid(composer, node)
+        self.probes += 1
+        state[node] = (key, valid)
+        return valid
+
+    def _invalid_nodes(self, composer, dag, state):
+        """
+        The nodes that are invalid themselves, or downstream of one that is.
+        """
+        invalid = set()
+        for node in nx.topological_sort(dag):
+            if any(pred in invalid for pred in dag.predecessors(node)) or not (
+                self._valid(composer, state, node)
+            ):
+                invalid.add(node)
+        return invalid
+
+    def instructions(self, composer, dag=None):
+        """
+        What calculating the whole composer would do for each node, as
+        `get_execution_instructions` would answer it, without asking the
+        backend about nodes it has already been asked about.
+        """
+        dag = composer.dag() if dag is None else dag
+        state = self._state(composer)
+        with self._lock:
+            invalid = self._invalid_nodes(composer, dag, state)
+
+        instructions = {}
+        for node in dag:
+            if node in invalid:
+                instructions[node] = NodeInstruction.CALCULATE
+            elif any(succ in invalid for succ in dag.successors(node)):
+                instructions[node] = NodeInstruction.RETRIEVE
+            else:
+                instructions[node] = NodeInstruction.IGNORE
+        return instructions
+
+    def _mark(self, composer, nodes, valid):
+        state = self._state(composer)
+        with self._lock:
+            for node in nodes:
+                if node in composer._functions:
+                    state[node] = (fingerprint(composer, node), valid)
+
+    def invalidate(self, composer, *nodes):
+        """
+        Records a `composer.cache_invalidate(*nodes)`.
+        """
+        dag = composer.dag()
+        invalidated = set(nodes)
+        for node in nodes:
+            invalidated.update(nx.descendants(dag, node))
+        self._mark(composer, invalidated, False)
+
+    def clear(self):
+        self._states.clear()
+
+    def calculation_callback(self, composer):
+        """
+        A progress callback for calculating the composer that keeps the index
+        up to date.
+        """
+
+        def callback(event_type, details):
+            if event_type == "prepared_calculation":
+                # The calculation has just invalidated everything downstream
+                # of an invalid node in the backend
+                state = self._state(composer)
+                with self._lock:
+                    invalid = self._invalid_nodes(composer, composer.dag(), state)
+                self._mark(composer, invalid, False)
+            elif event_type == "end_cache_store":
+                self._mark(composer, [details["name"]], True)
+
+        return callback
@@ -1,6 +1,8 @@
+import json
 import os
 import time
 import traceback
+from datetime import date, datetime
 from importlib import import_module, invalidate_caches
 from io import StringIO
 from pathlib import Path
@@ -10,6 +12,7 @@ import sh
 
 import fn_graph.examples
 from fn_graph_studio import run_studio
+from fn_graph_studio.tracing import DEFAULT_TRACE_DIR, Tracer, read_traces
 
 
 @click.group()
@@ -17,7 +20,21 @@ def cli():
     pass
 
 
-def _run_module(composer, clear):
+def _load_composer(composer):
+    """
+    Loads a composer from either a 'path.to.module:obj' spec or an example name.
+    """
+    if ":" not in composer:
+        composer = f"fn_graph.examples.{composer}:f"
+    module_path, obj_path = composer.split(":")
+    return getattr(import_module(module_path), obj_path)
+
+
+def _tracer(traces):
+    return Tracer(directory=DEFAULT_TRACE_DIR if traces else None)
+
+
+def _run_module(composer, clear, **studio_kwargs):
 
     try:
         module_path, obj_path = composer.split(":")
@@ -46,7 +63,7 @@ def _run_module(composer, clear):
                 os.system("cls" if os.name == "nt" else "clear")
             # Run the studio
             click.echo(click.style(f"Running studio {module_path}", fg="green"))
-            run_studio(composer_obj)
+            run_studio(composer_obj, **studio_kwargs)
             # When the dash runner is killed via ctrl-c this will exit
             break
         except KeyboardInterrupt:
@@ -69,7 +86,14 @@ def _run_module(composer, clear):
 @click.command()
 @click.argument("composer")
 @click.option("--clear/--no-clear", "clear", default=True)
-def run(composer, clear):
+@click.option(
+    "--record", default=None, help="Record the callback payloads to this file."
+)
+@click.option("--warm", is_flag=True, help="Warm the cache when the studio starts.")
+@click.option(
+    "--traces", is_flag=True, help=f"Write request traces to {DEFAULT_TRACE_DIR}."
+)
+def run(composer, clear, record, warm, traces):
     """
     Runs a studio for a composer specified by it's module.
 
@@ -78,7 +102,13 @@ def run(composer, clear):
     The COMPOSER path must be specified path.to.module:obj where path.to.module 
     is a python module path and obj is the name of the composer object in that module.
     """
-    _run_module(composer, clear)
+    _run_module(
+        composer,
+        clear,
+        record_session=record,
+        warm_on_start=warm,
+        tracer=_tracer(traces),
+    )
 
 
 EXAMPLES = {
@@ -124,8 +154,391 @@ def example(example, clear):
         click.echo(buffer.read())
 
 
+@click.command()
+@click.argument("at")
+@click.option("--window", default=60, help="Seconds either side of AT to search.")
+@click.option("--directory", default=DEFAULT_TRACE_DIR, help="The trace directory.")
+def traces(at, window, directory):
+    """
+    Prints the traces of the requests made around a given time.
+
+    AT is either a time today, e.g. 14:05, or a full ISO timestamp.
+    """
+    try:
+        around = datetime.fromisoformat(at)
+    except ValueError:
+        try:
+            time_of_day = datetime.strptime(at, "%H:%M").time()
+        except ValueError:
+            raise click.BadParameter(
+                f"{at!r} is neither a time, e.g. 14:05, nor an ISO timestamp",
+                param_hint="AT",
+            )
+        around = datetime.combine(date.today(), time_of_day)
+
+    found = read_traces(Path(directory) / "traces.jsonl", around, window)
+
+    for trace_id, spans in found.items():
+        children = {}
+        for span in spans:
+            children.setdefault(span.get("parentId"), []).append(span)
+
+        def echo_span(span, depth):
+            tags = " ".join(f"{k}={v}" for k, v in span["tags"].items())
+            click.echo(
+                f"{'  ' * depth}{span['name']} {span['duration'] / 1e6:.3f}s {tags}"
+            )
+            for child in sorted(
+                children.get(span["id"], []), key=lambda s: s["timestamp"]
+            ):
+                echo_span(child, depth + 1)
+
+        for root in children.get(None, []):
+            started = datetime.fromtimestamp(root["timestamp"] / 1e6)
+            click.echo(
+                click.style(f"{started.isoformat()} trace {trace_id}", fg="green")
+            )
+            echo_span(root, 1)
+
+
+@click.command()
+@click.option("--nodes", default=100, help="Number of nodes in the composer.")
+@click.option("--depth", default=10, help="Number of layers of nodes.")
+@click.option("--fan-out", default=2, help="Downstream nodes fed by each node.")
+@click.option("--namespace-depth", default=2, help="Namespace nesting of nodes.")
+@click.option("--parameters", default=10, help="Number of parameters.")
+@click.option("--result-size", default=10_000, help="Rows or points per result.")
+@click.option("--repeat", default=5, help="Times to repeat each benchmark.")
+@click.option(
+    "--query-rows", default=1_000_000, help="Rows of the query benchmark, 0 to skip."
+)
+@click.option("--output", default=None, help="File to write the JSON report to.")
+def benchmark(output, repeat, query_rows, **composer_options):
+    """
+    Benchmarks the studio against a synthetic composer.
+
+    Prints a JSON report of the timings of every studio callback and renderer.
+    """
+    from fn_graph_studio.benchmarks import run_benchmarks, write_report
+
+    report = run_benchmarks(
+        repeat=repeat, query_rows=query_rows, **composer_options
+    )
+    click.echo(write_report(report, output))
+
+
+@click.command()
+@click.argument("composer")
+@click.option("--session", default=None, help="A session recorded with run --record.")
+@click.option("--users", default=10, help="Number of concurrent simulated users.")
+@click.option("--iterations", default=1, help="Times each user replays the session.")
+@click.option("--pace", default=0.0, help="Scale of the recorded delays, 0 for none.")
+@click.option("--output", default=None, help="File to write the JSON report to.")
+def loadtest(composer, session, users, iterations, pace, output):
+    """
+    Load tests a studio started locally for a composer.
+
+    COMPOSER is either a 'path.to.module:obj' path or the name of an example.
+
+    Without a recorded session a synthetic one is used that visits every node
+    and edits every numeric parameter.
+    """
+    from fn_graph_studio.loadtest import (
+        read_session,
+        replay,
+        start_local_studio,
+        synthetic_session,
+    )
+
+    composer_obj = _load_composer(composer)
+    entries = read_session(session) if session else synthetic_session(composer_obj)
+
+    url, server = start_local_studio(composer_obj)
+    try:
+        report = replay(url, entries, users=users, iterations=iterations, pace=pace)
+    finally:
+        server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    click.echo(text)
+
+
+@click.command()
+@click.argument("composer")
+@click.option(
+    "--node",
+    "nodes",
+    multiple=True,
+    help="Warm this node and what it depends on, repeatable. Defaults to all.",
+)
+@click.option("--descendants", is_flag=True, help="Also warm each node's descendants.")
+@click.option("--workers", default=4, help="Nodes calculated at the same time.")
+def warm(composer, nodes, descendants, workers):
+    """
+    Calculates the nodes of a composer to fill its cache.
+
+    COMPOSER is either a 'path.to.module:obj' path or the name of an example.
+
+    Nodes are calculated in dependency order, independent ones in parallel.
+    The composer must have a persistent cache, e.g. the development cache, for
+    a studio started later to benefit.
+    """
+    from fn_graph_studio.warming import Warming, warm_nodes
+
+    composer_obj = _load_composer(composer)
+    try:
+        warming = Warming(
+            composer_obj,
+            warm_nodes(composer_obj, list(nodes) or None, descendants=descendants),
+            workers=workers,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    with click.progressbar(length=warming.total, label="Warming") as bar:
+        warming.run(progress=lambda warming: bar.update(1))
+
+    for node, error in warming.failed.items():
+        click.echo(click.style(f"{node}: {error}", fg="red"))
+    click.echo(warming.summary())
+    if warming.failed:
+        exit(1)
+
+
+@click.command()
+@click.argument("composer")
+@click.option(
+    "--node", "nodes", multiple=True, required=True, help="A node to calculate."
+)
+@click.option(
+    "--param",
+    "params",
+    multiple=True,
+    help="Values of a parameter to sweep, NAME=VALUE,VALUE,... Repeatable.",
+)
+@click.option(
+    "--grid",
+    default=None,
+    help="A JSON file of {parameter: [values]}, or of a list of parameter sets.",
+)
+@click.option("--workers", default=os.cpu_count(), help="Processes, 0 for none.")
+@click.option("--output", default="sweep", help="The directory to write results to.")
+def sweep(composer, nodes, params, grid, workers, output):
+    """
+    Calculates nodes of a composer without a studio, across a grid of
+    parameter values.
+
+    COMPOSER is either a 'path.to.module:obj' path or the name of an example.
+
+    Every combination of the --param values (and --grid) is calculated, with
+    the results and profile of each written to a directory of OUTPUT, and a
+    summary to OUTPUT/manifest.json. Without either the nodes are calculated
+    once with the composer's parameters.
+    """
+    from fn_graph_studio.sweep import grid_points, parse_value, run_sweep
+
+    parameters = _load_composer(composer).parameters()
+    values = {}
+    points = None
+    if grid:
+        with open(grid) as f:
+            loaded = json.load(f)
+        if isinstance(loaded, list):
+            points = loaded
+        else:
+            values.update(loaded)
+    for param in params:
+        name, _, raw = param.partition("=")
+        if name not in parameters:
+            raise click.BadParameter(
+                f"Unknown parameter {name!r}", param_hint="--param"
+            )
+        try:
+            values[name] = [
+                parse_value(parameters[name][0], v) for v in raw.split(",")
+            ]
+        except ValueError as e:
+            raise click.BadParameter(
+                f"Could not read {name!r}: {e}", param_hint="--param"
+            )
+    if values:
+        points = [
+            {**point, **values_point}
+            for point in points or [{}]
+            for values_point in grid_points(values)
+        ]
+
+    with click.progressbar(length=len(points or [{}]), label="Sweeping") as bar:
+        try:
+            manifest = run_sweep(
+                _load_composer,
+                composer,
+                nodes,
+                points,
+                output,
+                workers=workers,
+                progress=lambda finished: bar.update(len(finished)),
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    failed = [point for point in manifest["points"] if "error" in point]
+    for point in failed:
+        click.echo(
+            click.style(f"{point['parameters']}: {point['error']}", fg="red")
+        )
+    click.echo(
+        f"Calculated {len(manifest['points']) - len(failed)} of "
+        f"{len(manifest['points'])} points in {manifest['seconds']:.1f}s, "
+        f"results in {output}"
+    )
+    if failed:
+        exit(1)
+
+
+@click.command()
+@click.argument("composer")
+@click.option(
+    "--node",
+    "nodes",
+    multiple=True,
+    help="Export this node and what it depends on, repeatable. Defaults to all.",
+)
+@click.option(
+    "--param",
+    "params",
+    multiple=True,
+    help="The value of a parameter, NAME=VALUE. Repeatable.",
+)
+@click.option("--workers", default=4, help="Nodes calculated at the same time.")
+@click.option("--output", default="snapshot", help="The directory to export to.")
+def export(composer, nodes, params, workers, output):
+    """
+    Exports the results of a composer to a snapshot, served by the snapshot
+    command without calculating anything.
+
+    COMPOSER is either a 'path.to.module:obj' path or the name of an example.
+    """
+    from fn_graph_studio.snapshot import export_snapshot
+    from fn_graph_studio.sweep import parse_value
+
+    composer_obj = _load_composer(composer)
+    composer_parameters = composer_obj.parameters()
+    parameters = {}
+    for param in params:
+        name, _, raw = param.partition("=")
+        if name not in composer_parameters:
+            raise click.BadParameter(
+                f"Unknown parameter {name!r}", param_hint="--param"
+            )
+        try:
+            parameters[name] = parse_value(composer_parameters[name][0], raw)
+        except ValueError as e:
+            raise click.BadParameter(
+                f"Could not read {name!r}: {e}", param_hint="--param"
+            )
+
+    with click.progressbar(length=0, label="Calculating") as bar:
+
+        def progress(warming):
+            bar.length = warming.total
+            bar.update(1)
+
+        manifest = export_snapshot(
+            composer_obj,
+            output,
+            nodes=list(nodes) or None,
+            parameters=parameters,
+            workers=workers,
+            progress=progress,
+        )
+
+    failed = {node: e["error"] for node, e in manifest["nodes"].items() if "error" in e}
+    for node, error in failed.items():
+        click.echo(click.style(f"{node}: {error}", fg="red"))
+    click.echo(
+        f"Exported {len(manifest['nodes']) - len(failed)} of "
+        f"{len(manifest['nodes'])} nodes in {manifest['seconds']:.1f}s to {output}"
+    )
+
+
+@click.command()
+@click.argument("directory")
+def snapshot(directory):
+    """
+    Runs a studio serving a snapshot written by the export command.
+    """
+    from fn_graph_studio import run_snapshot_studio
+
+    run_snapshot_studio(directory)
+
+
+@click.command()
+@click.argument("composers", nargs=-1, required=True)
+@click.option(
+    "--memory-budget",
+    default=None,
+    type=float,
+    help="Megabytes of in memory caches to keep across composers.",
+)
+@click.option(
+    "--idle-minutes",
+    default=None,
+    type=float,
+    help="Evict composers not used for this many minutes.",
+)
+@click.option(
+    "--record", default=None, help="Record the callback payloads to this file."
+)
+@click.option(
+    "--traces", is_flag=True, help=f"Write request traces to {DEFAULT_TRACE_DIR}."
+)
+def serve(composers, memory_budget, idle_minutes, record, traces):
+    """
+    Runs one studio serving many composers, each under its own URL prefix.
+
+    Each of COMPOSERS is either a 'path.to.module:obj' path or the name of an
+    example, served under the last part of its module path, or PREFIX=COMPOSER
+    to choose the prefix. Composers are imported on their first request, and
+    the first is also served at /.
+    """
+    from fn_graph_studio import run_registry_studio
+
+    registry = {}
+    for composer in composers:
+        prefix, _, spec = composer.rpartition("=")
+        if not prefix:
+            prefix = spec.partition(":")[0].split(".")[-1]
+        if prefix in registry:
+            raise click.BadParameter(
+                f"The prefix {prefix!r} is used twice", param_hint="COMPOSERS"
+            )
+        registry[prefix] = spec if ":" in spec else f"fn_graph.examples.{spec}:f"
+
+    for prefix, spec in registry.items():
+        click.echo(f"/{prefix} {spec}")
+    run_registry_studio(
+        registry,
+        memory_budget=memory_budget * 1e6 if memory_budget else None,
+        idle_seconds=idle_minutes * 60 if idle_minutes else None,
+        record_session=record,
+        tracer=_tracer(traces),
+    )
+
+
 cli.add_command(run)
 cli.add_command(example)
+cli.add_command(traces)
+cli.add_command(benchmark)
+cli.add_command(loadtest)
+cli.add_command(warm)
+cli.add_command(sweep)
+cli.add_command(export)
+cli.add_command(snapshot)
+cli.add_command(serve)
 
 if __name__ == "__main__":
     cli()
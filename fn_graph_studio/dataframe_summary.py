@@ -0,0 +1,160 @@
+"""
+Column profiles of DataFrames.
+
+The profile is computed from a sample once the frame has more than
+`sample_rows` rows, with each statistic computed for every column at once
+where pandas allows it, so profiling a wide frame is a handful of vectorized
+passes rather than a pass per column per statistic.
+"""
+import numpy as np
+import pandas as pd
+
+QUANTILES = [0, 0.25, 0.5, 0.75, 1]
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def estimate_distinct(distinct, singletons, rows, sample_rows):
+    """
+    Estimates the distinct values in `rows` rows from the `distinct` values of
+    a sample of `sample_rows` rows, `singletons` of which were seen once, with
+    the GEE estimator: values seen once in the sample are scaled up, values
+    seen more often are assumed all seen.
+    """
+    if sample_rows >= rows:
+        return distinct
+    if singletons == sample_rows:
+        # Every sampled value is unique, most likely a key
+        return rows
+    return int(round(np.sqrt(rows / sample_rows) * singletons)) + (
+        distinct - singletons
+    )
+
+
+def _count_summary(counts):
+    """
+    The distinct values, singletons and most common value with its count, per
+    column position, of value counts indexed by column position and value.
+    """
+    counts = counts.sort_values(ascending=False, kind="stable")
+    by_position = counts.groupby(level=0, sort=False)
+    distinct = by_position.size()
+    singletons = counts.eq(1).groupby(level=0, sort=False).sum()
+    top = by_position.head(1)
+    return {
+        position: (int(distinct[position]), int(singletons[position]), value, count)
+        for (position, value), count in top.items()
+    }
+
+
+def count_summaries(frame):
+    """
+    The distinct values, singletons and most common value with its count of
+    every column with any values, by column position.
+
+    Columns of a dtype are counted together, in one groupby over the stacked
+    columns, and column by column only when some values are unhashable.
+    """
+    summaries = {}
+    positions = pd.Series(range(len(frame.columns)))
+    for _, block in positions.groupby(frame.dtypes.astype(str).to_numpy()):
+        columns = frame.iloc[:, block.to_numpy()].set_axis(block.to_numpy(), axis=1)
+        try:
+            counts = (
+                columns.melt(var_name="position")
+                .groupby(["position", "value"], sort=False)
+                .size()
+            )
+        except TypeError:
+            # e.g. lists
+            for position in columns.columns:
+                try:
+                    counts = columns[position].value_counts()
+                except TypeError:
+                    continue
+                if len(counts):
+                    summaries[position] = (
+                        len(counts),
+                        int(counts.eq(1).sum()),
+                        counts.index[0],
+                        counts.iloc[0],
+                    )
+            continue
+        summaries.update(_count_summary(counts))
+    return summaries
+
+
+def is_numeric(values):
+    return pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(
+        values
+    )
+
+
+def sparkline(values, bins=10):
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return ""
+    histogram, _ = np.histogram(finite, bins=bins)
+    scaled = np.ceil(histogram / histogram.max() * (len(SPARK_BLOCKS) - 1))
+    return "".join(SPARK_BLOCKS[int(level)] for level in scaled)
+
+
+def profile_dataframe(frame, sample_rows=100_000, seed=0):
+    """
+    A profile row per column: dtype, nulls, distinct values, quantiles for
+    numeric and datetime columns, the most common value otherwise, and a
+    histogram sparkline for numeric columns.
+    """
+    rows = len(frame)
+    sampled = rows > sample_rows
+    sample = frame.sample(sample_rows, random_state=seed) if sampled else frame
+    scale = rows / len(sample) if len(sample) else 1
+
+    nulls = sample.isna().sum()
+    numeric = sample.select_dtypes(include=["number", "datetime"])
+    numeric = numeric.loc[:, [dtype != bool for dtype in numeric.dtypes]]
+    quantiles = (
+        numeric.quantile(QUANTILES, numeric_only=False)
+        if len(numeric.columns)
+        else pd.DataFrame()
+    )
+    if sampled and len(numeric.columns):
+        # The extremes are rarely in the sample, but are cheap to find exactly
+        full = frame[numeric.columns]
+        quantiles.iloc[0] = full.min()
+        quantiles.iloc[-1] = full.max()
+
+    summaries = count_summaries(sample)
+
+    profile = []
+    for position, column in enumerate(sample.columns):
+        values = sample.iloc[:, position]
+        entry = dict(
+            column=str(column),
+            dtype=str(values.dtype),
+            nulls=int(round(nulls.iloc[position] * scale)),
+            null_fraction=nulls.iloc[position] / len(sample) if len(sample) else 0,
+            distinct=(
+                estimate_distinct(*summaries[position][:2], rows, len(sample))
+                if position in summaries
+                else None
+            ),
+        )
+        if column in quantiles.columns and not numeric.columns.duplicated().any():
+            column_quantiles = quantiles[column]
+            entry.update(
+                min=column_quantiles.iloc[0],
+                p25=column_quantiles.iloc[1],
+                median=column_quantiles.iloc[2],
+                p75=column_quantiles.iloc[3],
+                max=column_quantiles.iloc[4],
+            )
+            if is_numeric(values):
+                entry["histogram"] = sparkline(
+                    values.to_numpy(dtype=float, na_value=np.nan)
+                )
+        elif position in summaries:
+            _, _, top, top_count = summaries[position]
+            entry.update(top=top, top_count=int(top_count))
+        profile.append(entry)
+
+    return dict(rows=rows, sampled=sampled, sample_rows=len(sample), columns=profile)
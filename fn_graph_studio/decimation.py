@@ -0,0 +1,180 @@
+"""
+Server side decimation of large plotly figures.
+
+Long traces are reduced with min/max bucketing, which keeps the extremes of
+every bucket so peaks and troughs survive. The full resolution data is kept
+so that zooming in can re-decimate just the visible range.
+"""
+import base64
+
+import numpy as np
+
+DECIMATED_TRACE_TYPES = {"scatter", "scattergl"}
+
+# Per point attributes that have to be decimated along with x and y
+PER_POINT_KEYS = ["text", "hovertext", "customdata", "ids"]
+PER_POINT_MARKER_KEYS = ["color", "size", "symbol", "opacity"]
+
+
+def as_array(value):
+    """
+    The value of a figure dictionary's data array as a numpy array, plotly
+    encodes numpy arrays as base64 typed arrays.
+    """
+    if isinstance(value, dict) and "bdata" in value:
+        array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+        if "shape" in value:
+            shape = value["shape"]
+            if isinstance(shape, str):
+                shape = [int(size) for size in shape.split(",")]
+            array = array.reshape(shape)
+        return array
+    return np.asarray(value)
+
+
+def minmax_indices(y, max_points):
+    """
+    The indices of the minimum and maximum of each of `max_points / 2`
+    equally sized buckets of y, plus the first and last point, in order.
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    padding = buckets * size - n
+
+    y = np.asarray(y, dtype=float)
+    low = np.concatenate([np.where(np.isnan(y), np.inf, y), np.full(padding, np.inf)])
+    high = np.concatenate(
+        [np.where(np.isnan(y), -np.inf, y), np.full(padding, -np.inf)]
+    )
+
+    offsets = np.arange(buckets) * size
+    minima = offsets + low.reshape(buckets, size).argmin(axis=1)
+    maxima = offsets + high.reshape(buckets, size).argmax(axis=1)
+
+    indices = np.unique(np.concatenate([[0, n - 1], minima, maxima]))
+    return indices[indices < n]
+
+
+def _as_range_bound(value, x):
+    if x.dtype.kind == "M":
+        return np.datetime64(str(value).replace(" ", "T"))
+    return float(value)
+
+
+def _take(trace, indices, n):
+    """
+    A copy of the trace with every per point attribute indexed.
+    """
+
+    def take(value):
+        if isinstance(value, dict) and "bdata" in value:
+            value = as_array(value)
+        if value is not None and not isinstance(value, (str, dict)):
+            try:
+                if len(value) == n:
+                    return np.asarray(value)[indices]
+            except TypeError:
+                pass
+        return value
+
+    trace = dict(trace)
+    for key in PER_POINT_KEYS:
+        if key in trace:
+            trace[key] = take(trace[key])
+    if isinstance(trace.get("marker"), dict):
+        trace["marker"] = {
+            key: take(value) if key in PER_POINT_MARKER_KEYS else value
+            for key, value in trace["marker"].items()
+        }
+    return trace
+
+
+class DecimatedFigure:
+    """
+    Holds the full resolution data of the large traces of a plotly figure and
+    produces decimated figures for the full or a zoomed x range.
+    """
+
+    def __init__(self, figure, max_points):
+        self.max_points = max_points
+        self.figure = figure.to_dict() if hasattr(figure, "to_dict") else figure
+        self.series = {}
+
+        for i, trace in enumerate(self.figure.get("data", [])):
+            if trace.get("type", "scatter") not in DECIMATED_TRACE_TYPES:
+                continue
+            if trace.get("y") is None:
+                continue
+            try:
+                y = as_array(trace["y"]).astype(float)
+            except (TypeError, ValueError):
+                continue
+            if y.ndim != 1 or len(y) <= max_points:
+                continue
+            x = as_array(trace["x"]) if trace.get("x") is not None else None
+            if x is None or x.dtype.kind not in "iufM":
+                x_sorted = False
+            else:
+                x_sorted = bool(np.all(x[1:] >= x[:-1]))
+            self.series[i] = (x, y, x_sorted)
+
+    @property
+    def decimated(self):
+        return bool(self.series)
+
+    @property
+    def total_points(self):
+        return sum(len(y) for _, y, _ in self.series.values())
+
+    def render(self, x_range=None):
+        """
+        The decimated figure as a dictionary, optionally restricted to an x
+        range in which case the traces are decimated at higher resolution.
+        """
+        data = list(self.figure.get("data", []))
+        for i, (x, y, x_sorted) in self.series.items():
+            n = len(y)
+            if x_range is not None and x is not None and x.dtype.kind in "iufM":
+                low, high = (_as_range_bound(bound, x) for bound in x_range)
+                if x_sorted:
+                    start, end = np.searchsorted(x, [low, high])
+                    # Keep a point either side so lines run to the edges
+                    window = np.arange(max(start - 1, 0), min(end + 1, n))
+                else:
+                    window = np.flatnonzero((x >= low) & (x <= high))
+                indices = window[minmax_indices(y[window], self.max_points)]
+            else:
+                indices = minmax_indices(y, self.max_points)
+
+            trace = _take(data[i], indices, n)
+            trace["y"] = y[indices]
+            if x is not None:
+                trace["x"] = x[indices]
+            else:
+                trace["x"] = indices
+            data[i] = trace
+
+        layout = dict(self.figure.get("layout", {}))
+        # Keep the zoom when the figure is replaced
+        layout.setdefault("uirevision", "decimated")
+        return dict(data=data, layout=layout)
+
+    def render_for_relayout(self, relayout_data):
+        """
+        Re-renders in response to a dcc.Graph relayoutData event, returns None
+        if the event does not change the x range.
+        """
+        relayout_data = relayout_data or {}
+        if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+            return self.render(
+                (relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"])
+            )
+        if "xaxis.range" in relayout_data:
+            return self.render(relayout_data["xaxis.range"])
+        if relayout_data.get("xaxis.autorange"):
+            return self.render()
+        return None
@@ -0,0 +1,59 @@
+"""
+Syntax highlighted function definitions.
+
+The highlighted HTML is cached by a hash of the source, so each definition is
+highlighted once however often it is viewed. The source is cached per function
+object. Reloading a module creates new function objects, so after a reload the
+source is read afresh, and only functions whose source changed are highlighted
+again.
+"""
+import hashlib
+import linecache
+
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import PythonLexer
+
+from .lru_cache import LRUCache
+
+
+class DefinitionCache:
+    def __init__(self, maxsize=4096):
+        self.sources = LRUCache(maxsize=maxsize)
+        self.highlighted = LRUCache(maxsize=maxsize)
+
+    def source(self, composer, function_name):
+        fn = composer.raw_function(function_name)
+        if fn is None:
+            return composer.get_source(function_name)
+        return self.sources.get_for_object(
+            fn, lambda fn: composer.get_source(function_name), name=function_name
+        )
+
+    def get(self, composer, function_name):
+        """
+        The highlighted definition of the function, and whether it was cached.
+        """
+        source = self.source(composer, function_name)
+        key = hashlib.sha1(source.encode()).hexdigest()
+        cached = self.highlighted.get(key)
+        if cached is not None:
+            return cached, True
+
+        highlighted = highlight(source, PythonLexer(), HtmlFormatter())
+        self.highlighted.set(key, highlighted)
+        return highlighted, False
+
+    def warm(self, composer):
+        """
+        Highlights every function of the composer not already cached.
+        """
+        # Drop the lines of source files changed since they were read, so
+        # reloaded functions are not shown with stale source
+        linecache.checkcache()
+        for function_name in composer.functions():
+            try:
+                self.get(composer, function_name)
+            except Exception:
+                # e.g. builtins have no source, viewing them shows the error
+                pass
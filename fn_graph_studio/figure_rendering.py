@@ -0,0 +1,108 @@
+"""
+Rendering of matplotlib figures away from the callback threads.
+
+pyplot keeps global state and is not thread safe, while dash serves callbacks
+from many threads. Figures are therefore saved either on a single dedicated
+thread, or, when processes are configured, pickled and saved in parallel in a
+process pool. Either way the figure is closed once it has been rendered so
+pyplot does not hold on to it.
+"""
+
+import pickle
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from logging import getLogger
+
+log = getLogger(__name__)
+
+
+def close_figure(figure):
+    """
+    Removes the figure from pyplot's figure manager, if pyplot is in use.
+    """
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is not None:
+        pyplot.close(figure)
+
+
+def save_figure(figure, format, savefig_kwargs):
+    buffer = BytesIO()
+    figure.savefig(buffer, format=format, **savefig_kwargs)
+    return buffer.getvalue()
+
+
+def _save_pickled_figure(data, format, savefig_kwargs):
+    figure = pickle.loads(data)
+    try:
+        return save_figure(figure, format, savefig_kwargs)
+    finally:
+        close_figure(figure)
+
+
+def _initialize_worker():
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+class FigureRenderPool:
+    """
+    Saves figures to bytes, on a dedicated thread or in a pool of `processes`.
+
+    Figures that cannot be pickled are always rendered on the thread.
+    """
+
+    def __init__(self, processes=0):
+        self.processes = processes
+        self._thread = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="fn_graph_studio_figures"
+        )
+        self._process_pool = None
+        self._lock = threading.Lock()
+
+    def process_pool(self):
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    self.processes, initializer=_initialize_worker
+                )
+            return self._process_pool
+
+    def render(self, figure, format="svg", **savefig_kwargs):
+        try:
+            if self.processes:
+                try:
+                    data = pickle.dumps(figure)
+                except Exception:
+                    log.debug("Figure could not be pickled, rendering on thread")
+                else:
+                    return (
+                        self.process_pool()
+                        .submit(_save_pickled_figure, data, format, savefig_kwargs)
+                        .result()
+                    )
+
+            return self._thread.submit(
+                save_figure, figure, format, savefig_kwargs
+            ).result()
+        finally:
+            close_figure(figure)
+
+    def shutdown(self):
+        self._thread.shutdown(wait=False)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_figure_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = FigureRenderPool()
+        return _default_pool
@@ -0,0 +1,255 @@
+"""
+A pretty printer that formats lazily, within a character budget.
+
+`pprint.pformat` formats the whole object before anything can be shown, which
+for large results takes far longer, and far more memory, than showing the
+first screenful. Here the formatted text is produced as a stream of chunks,
+so formatting stops as soon as enough has been produced, and can be resumed
+to page through the rest.
+"""
+import threading
+from itertools import islice
+
+_BRACKETS = {
+    list: ("[", "]"),
+    tuple: ("(", ")"),
+    set: ("{", "}"),
+    frozenset: ("frozenset({", "})"),
+    dict: ("{", "}"),
+}
+
+
+def _container_type(obj):
+    """
+    The container type an object is formatted as, None for objects that are
+    formatted with their repr (including subclasses with their own repr).
+    """
+    for typ in _BRACKETS:
+        if isinstance(obj, typ) and type(obj).__repr__ is typ.__repr__:
+            return typ
+    return None
+
+
+def _summary(obj):
+    """
+    A short description of objects whose repr is known to be slow to produce
+    and long, e.g. DataFrames and arrays, or None for other objects.
+    """
+    shape = getattr(obj, "shape", None)
+    if isinstance(obj, type) or not isinstance(shape, tuple) or not shape:
+        # Numpy scalars have an empty shape, and a short repr
+        return None
+    return f"<{type(obj).__name__} of shape {shape}>"
+
+
+class _TooLong(Exception):
+    pass
+
+
+class ObjectFormatter:
+    """
+    Formats objects in the style of pprint, as a stream of chunks.
+
+    Containers with more than `max_items` items and strings longer than
+    `max_string` characters are elided, with a count of what was left out.
+    Objects with a shape inside containers, e.g. DataFrames and arrays, are
+    shown as their type and shape rather than their repr.
+    """
+
+    def __init__(self, width=80, max_items=1000, max_string=1000):
+        self.width = width
+        self.max_items = max_items
+        self.max_string = max_string
+        # The containers being formatted, as [type name, item, length]
+        self.stack = []
+        # The last repr produced, as format reprs a leaf that _inline has
+        # just found too long
+        self._last_repr = (None, None)
+
+    def location(self):
+        """
+        Where in the object the formatting currently is, outermost first.
+        """
+        return [
+            f"item {index + 1:,} of {length:,} in the {name}"
+            for name, index, length in self.stack
+        ]
+
+    def _repr(self, obj, nested):
+        """
+        The repr of a leaf, or its summary when it is inside a container.
+        """
+        if nested:
+            summary = _summary(obj)
+            if summary is not None:
+                return summary
+        last, text = self._last_repr
+        if last is not obj:
+            text = repr(obj)
+            self._last_repr = (obj, text)
+        return text
+
+    def _inline(self, obj, limit):
+        """
+        The single line form of the object, or None if it is longer than limit.
+        """
+        try:
+            return "".join(self._iter_inline(obj, [limit], bool(self.stack)))
+        except _TooLong:
+            return None
+
+    def _iter_inline(self, obj, remaining, nested):
+        def emit(text):
+            remaining[0] -= len(text)
+            if remaining[0] < 0:
+                raise _TooLong()
+            return text
+
+        typ = _container_type(obj)
+        if typ is None:
+            if isinstance(obj, str) and len(obj) > remaining[0]:
+                raise _TooLong()
+            yield emit(self._repr(obj, nested))
+            return
+
+        if len(obj) > self.max_items:
+            raise _TooLong()
+        if not obj and typ in (set, frozenset):
+            yield emit(f"{typ.__name__}()")
+            return
+
+        opening, closing = _BRACKETS[typ]
+        yield emit(opening)
+        for i, item in enumerate(obj.items() if typ is dict else obj):
+            if i:
+                yield emit(", ")
+            if typ is dict:
+                yield from self._iter_inline(item[0], remaining, True)
+                yield emit(": ")
+                yield from self._iter_inline(item[1], remaining, True)
+            else:
+                yield from self._iter_inline(item, remaining, True)
+        if typ is tuple and len(obj) == 1:
+            yield emit(",")
+        yield emit(closing)
+
+    def format(self, obj, indent=0, allowance=0):
+        """
+        Yields the formatted object in chunks.
+        """
+        inline = self._inline(obj, self.width - indent - allowance)
+        if inline is not None:
+            yield inline
+            return
+
+        typ = _container_type(obj)
+        if typ is None:
+            if isinstance(obj, str) and len(obj) > self.max_string:
+                yield repr(obj[: self.max_string])
+                yield f" ... ({len(obj) - self.max_string:,} more characters)"
+            else:
+                yield self._repr(obj, bool(self.stack))
+            self._last_repr = (None, None)
+            return
+
+        length = len(obj)
+        opening, closing = _BRACKETS[typ]
+        frame = [typ.__name__, 0, length]
+        self.stack.append(frame)
+
+        yield opening
+        indent += len(opening)
+        separator = ",\n" + " " * indent
+        items = obj.items() if typ is dict else obj
+        shown = min(length, self.max_items)
+        for i, item in enumerate(islice(items, shown)):
+            frame[1] = i
+            if i:
+                yield separator
+            last_allowance = allowance + len(closing) if i == length - 1 else 1
+            if typ is dict:
+                key, value = item
+                key_text = self._inline(key, self.width) or self._repr(key, True)
+                yield key_text + ": "
+                yield from self.format(
+                    value, indent + len(key_text) + 2, last_allowance
+                )
+            else:
+                yield from self.format(item, indent, last_allowance)
+
+        if length > shown:
+            yield f"{separator}... {length - shown:,} more items"
+        if typ is tuple and length == 1:
+            yield ","
+        yield closing
+
+        self.stack.pop()
+
+
+class FormattedPages:
+    """
+    The formatted text of an object, produced a page of `page_size`
+    characters at a time as the pages are asked for.
+    """
+
+    def __init__(self, obj, page_size=10_000, **formatter_kwargs):
+        self.page_size = page_size
+        self.formatter = ObjectFormatter(**formatter_kwargs)
+        self.pages = []
+        self.finished = False
+        self._chunks = self.formatter.format(obj)
+        self._pending = ""
+        self._lock = threading.Lock()
+
+    def _next_page(self):
+        pending = [self._pending]
+        size = len(self._pending)
+        while size < self.page_size:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.finished = True
+                break
+            pending.append(chunk)
+            size += len(chunk)
+
+        text = "".join(pending)
+        self.pages.append(text[: self.page_size])
+        self._pending = text[self.page_size :]
+
+    def text(self, pages=1):
+        """
+        The text of the first `pages` pages, formatting more as needed.
+        """
+        with self._lock:
+            while len(self.pages) < pages and not self.complete:
+                self._next_page()
+            return "".join(self.pages[:pages])
+
+    @property
+    def complete(self):
+        return self.finished and not self._pending
+
+    def summary(self, pages=1):
+        """
+        A description of how much of the object the first pages cover.
+        """
+        with self._lock:
+            if self.complete and pages >= len(self.pages):
+                return None
+            shown = sum(len(page) for page in self.pages[:pages])
+            location = self.formatter.location() if pages >= len(self.pages) else []
+            summary = f"Showing the first {shown:,} characters"
+            if location:
+                summary += ", up to " + ", ".join(reversed(location))
+            return summary
+
+
+def bounded_pformat(obj, max_length=10_000, **formatter_kwargs):
+    """
+    Formats the object like pformat, stopping after max_length characters.
+    """
+    pages = FormattedPages(obj, page_size=max_length, **formatter_kwargs)
+    text = pages.text()
+    summary = pages.summary()
+    return f"{text}...\n\n({summary})" if summary else text
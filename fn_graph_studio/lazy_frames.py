@@ -0,0 +1,154 @@
+"""
+Previews of lazily evaluated and out of core frames.
+
+Dask DataFrames and pyarrow Tables and Datasets can be far larger than memory,
+so the preview only computes what is displayed: the schema, the first rows and
+the partition count, with the row count estimated from the first partition
+when counting exactly would mean reading everything. Counting rows exactly and
+loading the whole frame into pandas only happen when asked for.
+"""
+import weakref
+
+
+class FramePreview:
+    """
+    What is shown of a lazy frame.
+
+    `rows` is exact if `rows_exact`, otherwise an estimate, or None if even
+    an estimate would be expensive.
+    """
+
+    def __init__(self, kind, schema, head, partitions, rows, rows_exact):
+        self.kind = kind
+        self.schema = schema
+        self.head = head
+        self.partitions = partitions
+        self.rows = rows
+        self.rows_exact = rows_exact
+
+
+def _is_dask(result):
+    return type(result).__module__.startswith("dask.")
+
+
+def _is_arrow_dataset(result):
+    return any(
+        f"{cls.__module__}.{cls.__qualname__}" == "pyarrow._dataset.Dataset"
+        for cls in type(result).__mro__
+    )
+
+
+def dask_preview(frame, rows):
+    # Only the first partition is computed, it gives the head and, scaled by
+    # the partition count, an estimate of the row count
+    first = frame.get_partition(0).compute()
+    return FramePreview(
+        kind="Dask DataFrame",
+        schema=[(str(name), str(dtype)) for name, dtype in frame.dtypes.items()],
+        head=first.head(rows),
+        partitions=frame.npartitions,
+        rows=len(first) * frame.npartitions,
+        rows_exact=frame.npartitions == 1,
+    )
+
+
+def arrow_table_preview(table, rows):
+    return FramePreview(
+        kind="Arrow Table",
+        schema=[(field.name, str(field.type)) for field in table.schema],
+        head=table.slice(0, rows).to_pandas(),
+        partitions=table.column(0).num_chunks if table.num_columns else 0,
+        rows=table.num_rows,
+        rows_exact=True,
+    )
+
+
+def arrow_dataset_preview(dataset, rows):
+    fragments = list(dataset.get_fragments())
+    head = dataset.head(rows)
+
+    estimate = None
+    if fragments:
+        # Parquet fragments count their rows from the file metadata
+        estimate = fragments[0].count_rows() * len(fragments)
+
+    return FramePreview(
+        kind="Arrow Dataset",
+        schema=[(field.name, str(field.type)) for field in dataset.schema],
+        head=head.to_pandas(),
+        partitions=len(fragments),
+        rows=estimate,
+        rows_exact=len(fragments) <= 1,
+    )
+
+
+def preview(result, rows=100):
+    if _is_dask(result):
+        return dask_preview(result, rows)
+    if _is_arrow_dataset(result):
+        return arrow_dataset_preview(result, rows)
+    return arrow_table_preview(result, rows)
+
+
+def preview_key(result):
+    """
+    A key that identifies the frame across calculations where possible.
+
+    Dask collections are named by a hash of their graph, and file datasets by
+    their files, so a recalculated but unchanged frame reuses its preview.
+    """
+    if _is_dask(result):
+        return ("dask", result._name)
+    files = getattr(result, "files", None)
+    if files is not None:
+        return ("dataset", tuple(files), str(result.schema))
+    return ("object", id(result))
+
+
+def cached_preview(cache, result, rows=100):
+    """
+    The preview of the result, reusing one from the cache if the cache has
+    one for this frame.
+    """
+    if cache is None:
+        return preview(result, rows)
+
+    key = preview_key(result) + (rows,)
+    entry = cache.get(key)
+    if entry is not None:
+        reference, cached = entry
+        # Keys built from ids are only valid while the object is alive
+        if key[0] != "object" or reference() is result:
+            return cached
+
+    result_preview = preview(result, rows)
+    try:
+        reference = weakref.ref(result)
+    except TypeError:
+        if key[0] == "object":
+            return result_preview
+        reference = None
+    cache.set(key, (reference, result_preview))
+    return result_preview
+
+
+def count_rows(result):
+    """
+    The exact row count, this reads the whole frame.
+    """
+    if _is_dask(result):
+        return int(result.shape[0].compute())
+    if _is_arrow_dataset(result):
+        return result.count_rows()
+    return result.num_rows
+
+
+def materialise(result):
+    """
+    The whole frame as a pandas DataFrame.
+    """
+    if _is_dask(result):
+        return result.compute()
+    if _is_arrow_dataset(result):
+        return result.to_table().to_pandas()
+    return result.to_pandas()
@@ -0,0 +1,327 @@
+"""
+Load testing for the studio.
+
+Sessions are recorded as the sequence of `_dash-update-component` payloads a
+browser sends (see `install_session_recorder`), and replayed by many
+concurrent simulated users against a studio started locally in a background
+thread. The report gives latency percentiles and error rates per callback and
+the growth in server memory over the run.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import flask
+
+UPDATE_PATH = "/_dash-update-component"
+
+
+def install_session_recorder(server, path):
+    """
+    Appends every callback payload received by the server to `path` as JSON
+    lines, along with the seconds since the recording started.
+    """
+    path = Path(path)
+    lock = threading.Lock()
+    started = time.time()
+
+    @server.before_request
+    def record_payload():
+        if flask.request.path != UPDATE_PATH:
+            return
+        payload = flask.request.get_json(silent=True)
+        if payload is None:
+            return
+        line = json.dumps(dict(offset=time.time() - started, payload=payload))
+        with lock:
+            with open(path, "a") as f:
+                f.write(line + "\n")
+
+
+def read_session(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _value(id, prop, value):
+    return {"id": id, "property": prop, "value": value}
+
+
+def synthetic_session(composer, nodes=None):
+    """
+    A session that visits each node's result, definition and profile, edits
+    each numeric parameter and flips between the sidebar tabs.
+
+    This allows load testing without a recording, it mirrors the payloads
+    the browser sends for the default studio layout.
+    """
+    parameters = composer.parameters()
+    session_id = uuid.uuid4().hex
+
+    def parameter_state(overrides):
+        # The browser sends only the parameters that differ from their
+        # defaults, under an id it hashes from them
+        if not overrides:
+            return None
+        text = json.dumps(overrides, sort_keys=True)
+        return dict(id=hashlib.sha1(text.encode()).hexdigest()[:8], changed=overrides)
+
+    def result(node, mode, overrides, changed):
+        return dict(
+            output="..result-function-name.children...result-type.children..."
+            "error-container.children...result-container.children..."
+            "cache-invalidation-store.data..",
+            inputs=[
+                _value("function-tree", "selected", node),
+                _value("result-processor", "value", ""),
+                _value("result-or-definition", "value", mode),
+                _value("invalidate-cache", "n_clicks", None),
+                _value("figure-format", "value", "auto"),
+                _value("scenario-selection", "value", []),
+                _value("url", "pathname", "/"),
+                _value("parameter-state", "data", parameter_state(overrides)),
+            ],
+            state=[
+                _value("cache-invalidation-store", "data", None),
+                _value("session-id", "data", session_id),
+                _value("scenario-store", "data", None),
+            ],
+            changedPropIds=[changed],
+        )
+
+    def graph(node, overrides):
+        return dict(
+            output="graphviz-viewer.dot_source",
+            inputs=[
+                _value("node-name-filter", "value", ""),
+                _value("graph-display-options", "value", ["parameters", "caching"]),
+                _value("graph-neighbourhood", "value", ["all"]),
+                _value("graph-neighbourhood-size", "value", 1),
+                _value("function-tree", "selected", node),
+                _value("url", "pathname", "/"),
+                _value("parameter-state", "data", parameter_state(overrides)),
+            ],
+            state=[_value("cache-invalidation-store", "data", None)],
+            changedPropIds=["function-tree.selected"],
+        )
+
+    def explorer(tab):
+        return dict(
+            output="..function-graph-holder.style...function-tree-holder.style..."
+            "parameters-holder.style...cache-holder.style...node-name-filter.style..",
+            inputs=[_value("explorer-selector", "value", tab)],
+            state=[],
+            changedPropIds=["explorer-selector.value"],
+        )
+
+    payloads = [
+        dict(
+            output="function-tree.data",
+            inputs=[
+                _value("node-name-filter", "value", ""),
+                _value("url", "pathname", "/"),
+            ],
+            state=[],
+            changedPropIds=["url.pathname"],
+        )
+    ]
+
+    nodes = nodes or sorted(composer.dag().nodes())
+    for node in nodes:
+        payloads.append(graph(node, {}))
+        payloads.append(result(node, "result", {}, "function-tree.selected"))
+        payloads.append(result(node, "definition", {}, "result-or-definition.value"))
+        payloads.append(result(node, "profiler", {}, "result-or-definition.value"))
+
+    payloads.append(explorer("parameters"))
+    for key, (type_, value) in parameters.items():
+        if issubclass(type_, (int, float)) and not issubclass(type_, bool):
+            overrides = {key: value * 2 or 1}
+            changed = "parameter-state.data"
+            for node in nodes:
+                payloads.append(result(node, "result", overrides, changed))
+    payloads.append(explorer("graph"))
+
+    return [dict(offset=0, payload=payload) for payload in payloads]
+
+
+def callback_name(payload):
+    """
+    A short name for the callback a payload targets, its first output.
+    """
+    output = payload["output"]
+    return output.strip(".").split("...")[0]
+
+
+def resident_memory():
+    """
+    The resident memory of this process in bytes, if it can be determined.
+
+    The local studio shares the process with the simulated users, so this
+    includes the (small) client overhead.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return None
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def start_local_studio(composer, studio_class=None, **kwargs):
+    """
+    Serves a studio for the composer from a background thread.
+
+    Returns the base url and the server, call `server.shutdown()` to stop it.
+    """
+    from dash import Dash
+    from werkzeug.serving import make_server
+
+    from . import Studio
+    from .tracing import Tracer
+
+    studio_class = studio_class or Studio
+    kwargs.setdefault("tracer", Tracer(directory=None))
+
+    app = Dash("fn_graph_studio", suppress_callback_exceptions=True)
+    studio_class(app, get_composer=lambda path: composer, **kwargs)
+
+    server = make_server("127.0.0.1", 0, app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def _post(url, payload, timeout):
+    request = urllib.request.Request(
+        url + UPDATE_PATH,
+        data=json.dumps(payload).encode("utf8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size, status = 0, e.code
+    except (urllib.error.URLError, OSError):
+        size, status = 0, None
+    return time.perf_counter() - start, status, size
+
+
+def with_session_id(payload, session_id):
+    """
+    The payload with the session-id store's value replaced, so each simulated
+    user has its own session rather than sharing the recorded one's results.
+    """
+
+    def replace(values):
+        if isinstance(values, list):
+            return [replace(value) for value in values]
+        if isinstance(values, dict) and values.get("id") == "session-id":
+            return dict(values, value=session_id)
+        return values
+
+    return {
+        key: replace(value) if key in ("inputs", "state") else value
+        for key, value in payload.items()
+    }
+
+
+def replay(url, session, users=10, iterations=1, pace=0.0, timeout=300):
+    """
+    Replays the session with `users` concurrent simulated users.
+
+    Each user sends the session's payloads in order, `pace` scales the
+    recorded delays between payloads (0 sends them back to back).
+    """
+    samples = []
+    lock = threading.Lock()
+
+    def user(index):
+        session_id = uuid.uuid4().hex
+        for _ in range(iterations):
+            previous_offset = session[0]["offset"] if session else 0
+            for entry in session:
+                if pace:
+                    time.sleep(max(entry["offset"] - previous_offset, 0) * pace)
+                previous_offset = entry["offset"]
+
+                duration, status, size = _post(
+                    url, with_session_id(entry["payload"], session_id), timeout
+                )
+                with lock:
+                    samples.append(
+                        (callback_name(entry["payload"]), duration, status, size)
+                    )
+
+    memory_before = resident_memory()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(user, range(users)))
+    elapsed = time.perf_counter() - start
+    memory_after = resident_memory()
+
+    by_callback = {}
+    for name, duration, status, size in samples:
+        by_callback.setdefault(name, []).append((duration, status, size))
+
+    def summarize(rows):
+        durations = [duration for duration, _, _ in rows]
+        # Dash answers callbacks that prevent their update with a 204
+        errors = sum(
+            1 for _, status, _ in rows if status is None or not 200 <= status < 300
+        )
+        return dict(
+            requests=len(rows),
+            errors=errors,
+            error_rate=errors / len(rows),
+            p50=percentile(durations, 0.5),
+            p95=percentile(durations, 0.95),
+            p99=percentile(durations, 0.99),
+            max=max(durations),
+            mean_bytes=sum(size for _, _, size in rows) / len(rows),
+        )
+
+    return dict(
+        users=users,
+        iterations=iterations,
+        requests=len(samples),
+        seconds=elapsed,
+        requests_per_second=len(samples) / elapsed if elapsed else None,
+        memory=dict(
+            before=memory_before,
+            after=memory_after,
+            growth=(
+                memory_after - memory_before
+                if memory_before is not None and memory_after is not None
+                else None
+            ),
+        ),
+        overall=(
+            summarize([row for rows in by_callback.values() for row in rows])
+            if samples
+            else None
+        ),
+        callbacks={name: summarize(rows) for name, rows in sorted(by_callback.items())},
+    )
@@ -0,0 +1,72 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread safe dictionary that evicts the least recently used entries once
+    it holds more than `maxsize` of them.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_for_object(self, obj, compute, name=""):
+        """
+        The value of `compute(obj)`, computed once per object (and name) for
+        as long as the object is alive and the entry has not been evicted.
+
+        Objects that cannot be weakly referenced are not cached.
+        """
+        key = (name, id(obj))
+        entry = self.get(key)
+        # Ids are reused once an object is freed, so check it is the same one
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+
+        value = compute(obj)
+        try:
+            reference = weakref.ref(obj)
+        except TypeError:
+            # Without a weak reference the entry could outlive the object
+            return value
+        self.set(key, (reference, value))
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
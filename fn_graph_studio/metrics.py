@@ -0,0 +1,347 @@
+"""
+In-process instrumentation for the studio.
+
+Counters and histograms are kept in memory and served in the Prometheus text
+exposition format, as well as on a small human readable diagnostics page.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from html import escape
+
+import flask
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+METRICS_PATH = "/_studio/metrics"
+DIAGNOSTICS_PATH = "/_studio/diagnostics"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile from the bucket counts, this is only as accurate
+        as the buckets are fine.
+        """
+        if self.count == 0:
+            return 0.0
+
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    A thread safe store of counters and histograms keyed by name and labels.
+    """
+
+    def __init__(self, prefix="fn_graph_studio"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._descriptions = {}
+        self._counters = {}
+        self._histograms = {}
+
+        self.describe(
+            "callback_requests_total", "counter", "Number of callback invocations"
+        )
+        self.describe(
+            "callback_errors_total", "counter", "Number of callbacks that raised"
+        )
+        self.describe(
+            "callback_seconds",
+            "histogram",
+            "Time spent in the callback body",
+            LATENCY_BUCKETS,
+        )
+        self.describe(
+            "stage_seconds",
+            "histogram",
+            "Time spent per stage (calculation, render, graphviz, ...)",
+            LATENCY_BUCKETS,
+        )
+        self.describe(
+            "result_cache_total",
+            "counter",
+            "Lookups of retained node results, by outcome (hit or miss)",
+        )
+        self.describe(
+            "definition_cache_total",
+            "counter",
+            "Lookups of highlighted definitions, by outcome (hit or miss)",
+        )
+        self.describe(
+            "snapshot_results_total",
+            "counter",
+            "Results served by a snapshot studio, by how (prerendered or rendered)",
+        )
+        self.describe(
+            "serialization_seconds",
+            "histogram",
+            "Time spent outside the callback body, dominated by JSON encoding",
+            LATENCY_BUCKETS,
+        )
+        self.describe(
+            "response_bytes",
+            "histogram",
+            "Size of the serialized callback response",
+            SIZE_BUCKETS,
+        )
+
+    def describe(self, name, kind, description, buckets=None):
+        self._descriptions[name] = (kind, description, buckets)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                _, _, buckets = self._descriptions.get(name, (None, None, None))
+                self._histograms[key] = Histogram(buckets or LATENCY_BUCKETS)
+            self._histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def instrument(self, fn, name=None):
+        """
+        Wraps a callback so its invocations, errors and duration are recorded.
+        """
+        name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            self.increment("callback_requests_total", callback=name)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                self.increment("callback_errors_total", callback=name)
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                self.observe("callback_seconds", duration, callback=name)
+                if flask.has_request_context():
+                    flask.g.studio_callback = (name, duration)
+
+        return wrapper
+
+    def prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+
+        def format_labels(labels, **extra):
+            labels = [*labels, *extra.items()]
+            if not labels:
+                return ""
+            inner = ",".join(
+                f'{key}="{escape_label_value(value)}"' for key, value in labels
+            )
+            return "{" + inner + "}"
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (
+                    histogram.buckets,
+                    list(histogram.counts),
+                    histogram.count,
+                    histogram.sum,
+                )
+                for key, histogram in self._histograms.items()
+            }
+
+        lines = []
+        for name, (kind, description, _) in self._descriptions.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {kind}")
+
+            if kind == "counter":
+                for (key, labels), value in sorted(counters.items()):
+                    if key == name:
+                        lines.append(f"{full_name}{format_labels(labels)} {value}")
+            else:
+                for (key, labels), (buckets, counts, count, total) in sorted(
+                    histograms.items()
+                ):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(
+                            f"{full_name}_bucket{format_labels(labels, le=repr(float(bound)))} {cumulative}"
+                        )
+                    lines.append(
+                        f"{full_name}_bucket{format_labels(labels, le='+Inf')} {count}"
+                    )
+                    lines.append(f"{full_name}_sum{format_labels(labels)} {total}")
+                    lines.append(f"{full_name}_count{format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Summary rows of every histogram, used for the diagnostics page.
+        """
+        with self._lock:
+            return [
+                dict(
+                    name=name,
+                    labels=", ".join(f"{k}={v}" for k, v in labels),
+                    count=histogram.count,
+                    mean=histogram.sum / histogram.count if histogram.count else 0,
+                    p50=histogram.quantile(0.5),
+                    p95=histogram.quantile(0.95),
+                    p99=histogram.quantile(0.99),
+                    max=histogram.max,
+                )
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+
+
+def instrumented_callbacks(app, *instruments):
+    """
+    Returns a drop in replacement for `app.callback` that instruments every
+    callback it registers. Instruments are anything with an `instrument(fn)`
+    method, the first is the outermost.
+    """
+
+    def callback(*args, **kwargs):
+        def decorator(fn):
+            name = fn.__name__
+            for instrument in reversed(instruments):
+                fn = instrument.instrument(fn, name=name)
+            return app.callback(*args, **kwargs)(fn)
+
+        return decorator
+
+    return callback
+
+
+def install_metrics_endpoints(server, metrics, endpoints=True):
+    """
+    Adds the metrics endpoint and diagnostics page to the flask server, unless
+    endpoints is False, and records response sizes and serialization time of
+    every callback.
+    """
+
+    # Several studios can share a server, only install once
+    if getattr(server, "_studio_metrics", None) is not None:
+        return
+    server._studio_metrics = metrics
+
+    @server.before_request
+    def start_request_timer():
+        flask.g.studio_request_start = time.perf_counter()
+
+    @server.after_request
+    def record_response(response):
+        callback = flask.g.pop("studio_callback", None)
+        if callback and not response.direct_passthrough:
+            name, callback_duration = callback
+            total = time.perf_counter() - flask.g.studio_request_start
+            metrics.observe(
+                "serialization_seconds",
+                max(total - callback_duration, 0),
+                callback=name,
+            )
+            metrics.observe("response_bytes", len(response.get_data()), callback=name)
+        return response
+
+    def metrics_view():
+        return flask.Response(
+            metrics.prometheus(), mimetype="text/plain; version=0.0.4"
+        )
+
+    def diagnostics_view():
+        columns = ["name", "labels", "count", "mean", "p50", "p95", "p99", "max"]
+
+        def format_cell(value):
+            return f"{value:,.4f}" if isinstance(value, float) else escape(str(value))
+
+        rows = "".join(
+            "<tr>"
+            + "".join(f"<td>{format_cell(row[column])}</td>" for column in columns)
+            + "</tr>"
+            for row in metrics.summary()
+        )
+        header = "".join(f"<th>{column}</th>" for column in columns)
+        return f"""
+        <!DOCTYPE html>
+        <html>
+            <head>
+                <title>Studio diagnostics</title>
+                <style>
+                    body {{ font-family: sans-serif; font-size: 0.9rem; }}
+                    td, th {{ padding: 3px 8px; text-align: left; }}
+                    tr:nth-child(even) {{ background: #eee; }}
+                </style>
+            </head>
+            <body>
+                <h2>Studio diagnostics</h2>
+                <p>
+                    Quantiles are estimated from histogram buckets.
+                    Seconds for timings, bytes for sizes.
+                    Raw metrics at <a href="{METRICS_PATH}">{METRICS_PATH}</a>.
+                </p>
+                <table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>
+            </body>
+        </html>
+        """
+
+    if endpoints:
+        server.add_url_rule(METRICS_PATH, "studio_metrics", metrics_view)
+        server.add_url_rule(DIAGNOSTICS_PATH, "studio_diagnostics", diagnostics_view)
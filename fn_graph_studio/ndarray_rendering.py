@@ -0,0 +1,235 @@
+"""
+Summaries and previews of numpy arrays.
+
+Everything here works on views of the array (strided slices, and reshapes of
+contiguous row ranges) and reduces them to small results, so a large array is
+never copied, and a memory mapped array only has the pages that are actually
+looked at read from disk.
+"""
+
+import numpy as np
+
+PERCENTILES = [1, 25, 50, 75, 99]
+
+
+def is_lazy(array):
+    return isinstance(array, np.memmap) or isinstance(
+        getattr(array, "base", None), np.memmap
+    )
+
+
+def has_statistics(array):
+    return (
+        np.issubdtype(array.dtype, np.number) or array.dtype == np.bool_
+    ) and not np.issubdtype(array.dtype, np.complexfloating)
+
+
+def strides_for(shape, max_size):
+    """
+    The per axis steps that reduce an array of `shape` to at most about
+    `max_size` elements, spread evenly over the axes.
+    """
+    size = int(np.prod(shape, dtype=np.int64))
+    if size <= max_size:
+        return [1] * len(shape)
+    factor = (size / max_size) ** (1 / max(len(shape), 1))
+    return [max(1, int(np.ceil(factor))) if length > 1 else 1 for length in shape]
+
+
+def strided_sample(array, max_size):
+    """
+    An evenly strided view of the array with at most about max_size elements.
+    """
+    steps = strides_for(array.shape, max_size)
+    return array[tuple(slice(None, None, step) for step in steps)]
+
+
+def summary_statistics(array, max_exact_size=5_000_000, sample_size=1_000_000):
+    """
+    Min, max, mean, NaN count and percentiles of a numeric array.
+
+    Memory mapped arrays and arrays with more than `max_exact_size` elements
+    are summarised from a strided sample of about `sample_size` elements.
+    """
+    sampled = is_lazy(array) or array.size > max_exact_size
+    values = strided_sample(array, sample_size) if sampled else array
+
+    if array.dtype == np.bool_:
+        values = values.view(np.uint8)
+
+    statistics = dict(sampled=sampled, sample_size=int(values.size))
+    if values.size == 0:
+        return statistics
+
+    if np.issubdtype(values.dtype, np.floating):
+        nans = np.isnan(values)
+        nan_count = int(np.count_nonzero(nans))
+        finite = values[~nans] if nan_count else values.reshape(-1)
+    else:
+        nan_count = 0
+        finite = values.reshape(-1)
+
+    statistics["nan_count"] = nan_count
+    if finite.size:
+        percentiles = np.percentile(finite, PERCENTILES)
+        statistics.update(
+            min=finite.min(),
+            max=finite.max(),
+            mean=finite.mean(dtype=np.float64),
+            percentiles=dict(zip(PERCENTILES, percentiles)),
+        )
+    return statistics
+
+
+def block_reduce_1d(array, buckets):
+    """
+    The x positions, minimum and maximum of each of `buckets` equal blocks of
+    a 1D array.
+    """
+    length = len(array)
+    if length <= buckets * 2:
+        x = np.arange(length)
+        return x, array, array
+
+    if is_lazy(array) or not array.flags.c_contiguous:
+        step = -(-length // (buckets * 2))
+        x = np.arange(0, length, step)
+        values = array[::step]
+        return x, values, values
+
+    block = length // buckets
+    blocks = array[: buckets * block].reshape(buckets, block)
+    x = np.arange(buckets) * block
+    return x, blocks.min(axis=1), blocks.max(axis=1)
+
+
+def block_reduce_2d(array, max_side):
+    """
+    The array reduced to at most max_side by max_side, by averaging blocks
+    of a contiguous array, or by striding through a lazy or strided one.
+    """
+    rows, columns = array.shape
+    row_block = -(-rows // max_side)
+    column_block = -(-columns // max_side)
+    if row_block == 1 and column_block == 1:
+        return array, 1, 1
+
+    if is_lazy(array) or not array.flags.c_contiguous:
+        return array[::row_block, ::column_block], row_block, column_block
+
+    row_count = rows // row_block
+    column_count = columns // column_block
+    # Reduce the rows first, slicing whole rows of a contiguous array and
+    # reshaping is a view, only the reduced result is new memory
+    reduced = (
+        array[: row_count * row_block]
+        .reshape(row_count, row_block, columns)
+        .mean(axis=1)
+    )
+    reduced = (
+        reduced[:, : column_count * column_block]
+        .reshape(row_count, column_count, column_block)
+        .mean(axis=2)
+    )
+    return reduced, row_block, column_block
+
+
+def preview_plane(array):
+    """
+    The 1D or 2D part of the array to preview, the first plane of arrays with
+    more dimensions.
+    """
+    if array.ndim <= 2:
+        return array, None
+    index = (0,) * (array.ndim - 2)
+    return array[index], index
+
+
+def preview_figure(array, max_points=2000, max_side=300):
+    """
+    A plotly line (1D) or heatmap (2D and up) preview of a numeric array.
+    """
+    import plotly.graph_objects as go
+
+    plane, index = preview_plane(array)
+    if array.dtype == np.bool_:
+        plane = plane.view(np.uint8)
+
+    if plane.ndim == 1:
+        x, low, high = block_reduce_1d(plane, max_points // 2)
+        if low is high:
+            traces = [go.Scattergl(x=x, y=low, mode="lines", name="value")]
+            title = f"Sampled every {x[1] - x[0] if len(x) > 1 else 1:,} values"
+        else:
+            traces = [
+                go.Scattergl(x=x, y=low, mode="lines", name="block min"),
+                go.Scattergl(
+                    x=x, y=high, mode="lines", name="block max", fill="tonexty"
+                ),
+            ]
+            title = f"Min and max of blocks of {x[1] - x[0]:,} values"
+        if len(x) == len(plane):
+            title = None
+        figure = go.Figure(traces)
+    else:
+        reduced, row_block, column_block = block_reduce_2d(plane, max_side)
+        figure = go.Figure(
+            go.Heatmap(
+                # Single precision is plenty for colours and halves the payload
+                z=reduced.astype(np.float32, copy=False),
+                x=np.arange(reduced.shape[1]) * column_block,
+                y=np.arange(reduced.shape[0]) * row_block,
+            )
+        )
+        figure.update_yaxes(autorange="reversed")
+        title = (
+            f"Blocks of {row_block:,} by {column_block:,} values"
+            if row_block > 1 or column_block > 1
+            else None
+        )
+
+    if index is not None:
+        title = ", ".join(filter(None, [f"Plane {index}", title]))
+    figure.update_layout(title=title, margin=dict(l=40, r=20, t=40, b=30))
+    return figure
+
+
+def table_page(array, page, page_size=50, max_columns=50):
+    """
+    The columns and records of a page of rows of the array's first plane.
+    """
+    plane, _ = preview_plane(array)
+    start = page * page_size
+    rows = plane[start : start + page_size]
+
+    if plane.ndim == 1:
+        columns = ["index", "value"]
+        records = [
+            {"index": start + i, "value": _cell(value)} for i, value in enumerate(rows)
+        ]
+    else:
+        shown = min(plane.shape[1], max_columns)
+        columns = ["index"] + [str(i) for i in range(shown)]
+        records = [
+            dict(
+                index=start + i,
+                **{str(j): _cell(value) for j, value in enumerate(row[:shown])},
+            )
+            for i, row in enumerate(rows)
+        ]
+    return columns, records
+
+
+def page_count(array, page_size=50):
+    plane, _ = preview_plane(array)
+    return max(1, -(-len(plane) // page_size)) if plane.ndim else 1
+
+
+def _cell(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return "nan"
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    return str(value)
@@ -1,9 +1,10 @@
 from collections import defaultdict
-from pprint import pformat
 
 import dash_core_components as dcc
 import dash_html_components as html
 
+from .formatting import bounded_pformat
+
 GREEN = "rgb(125, 194, 66)"
 
 
@@ -50,12 +51,94 @@ def create_input(key, type_, value, editable):
         )
     else:
         return html.Pre(
-            pformat(value),
+            bounded_pformat(value, max_length=2000),
             id={"type": "static-parameter", "key": key},
             style=dict(border="1px solid lightgrey", color="lightgrey"),
         )
 
 
+def widget_values(parameters):
+    """
+    The values of the parameters with an input widget, as the widgets hold
+    them.
+    """
+    return {
+        key: str(value) if issubclass(type_, bool) else value
+        for key, (type_, value) in parameters.items()
+        if get_parameter_attrs(key, type_)
+    }
+
+
+def parameter_values(state):
+    """
+    The parameter values of a parameter state sent by the browser.
+    """
+    return dict((state or {}).get("changed") or {})
+
+
+# Keeps the parameter state, the parameters whose widgets differ from their
+# defaults and an id hashed from them, in the browser. It is only updated when
+# the id changes, so callbacks fire once per edit however many parameters the
+# composer has.
+PARAMETER_STATE_FUNCTION = """
+function(values, defaults, state) {
+    var inputs = dash_clientside.callback_context.inputs_list[0];
+    if (!defaults || !inputs.length) {
+        return dash_clientside.no_update;
+    }
+    var changed = {};
+    inputs.forEach(function(input) {
+        var key = input.id.key;
+        if (JSON.stringify(input.value) !== JSON.stringify(defaults[key])) {
+            changed[key] = input.value;
+        }
+    });
+    // Sorts the keys of the top level only, a replacer array would also
+    // filter the keys of nested values
+    var sorted = {};
+    Object.keys(changed).sort().forEach(function(key) {
+        sorted[key] = changed[key];
+    });
+    var text = JSON.stringify(sorted);
+    var hash = 2166136261;
+    for (var i = 0; i < text.length; i++) {
+        hash = Math.imul(hash ^ text.charCodeAt(i), 16777619) >>> 0;
+    }
+    var id = hash.toString(16);
+    if (state && state.id === id) {
+        return dash_clientside.no_update;
+    }
+    return {id: id, changed: changed};
+}
+"""
+
+
+# Marks a parameter's label as modified when its widget differs from the
+# default, as the widgets are not rebuilt when a parameter is edited.
+PARAMETER_MODIFIED_FUNCTION = """
+function(value, defaults) {
+    if (!defaults) {
+        return dash_clientside.no_update;
+    }
+    var key = dash_clientside.callback_context.outputs_list[0].id.key;
+    var changed = JSON.stringify(value) !== JSON.stringify(defaults[key]);
+    return [
+        {
+            display: "flex",
+            justifyContent: "space-between",
+            fontWeight: "bold",
+            color: changed ? "%s" : null
+        },
+        {display: changed ? "inline" : "none"}
+    ];
+}
+""" % GREEN
+
+
+def label_id(type_, key, editable):
+    return dict(id={"type": type_, "key": key}) if editable else {}
+
+
 def title(string):
     return string.replace("_", " ").capitalize()
 
@@ -153,6 +236,8 @@ def parameter_widgets(initial_parameters, current_values, editable_parameters):
 
         else:
             function_name = value.id["key"]
+            # Only editable parameters are marked as they are edited
+            editable = value.id["type"] == "parameter"
             changed = (
                 function_name in current_values
                 and current_values[function_name]
@@ -164,8 +249,15 @@ def parameter_widgets(initial_parameters, current_values, editable_parameters):
                     html.Div(
                         [
                             html.Label(title(key)),
-                            html.Span("(modified)") if changed else None,
+                            html.Span(
+                                "(modified)",
+                                style=dict(display="inline" if changed else "none"),
+                                **label_id(
+                                    "parameter-modified", function_name, editable
+                                ),
+                            ),
                         ],
+                        **label_id("parameter-label", function_name, editable),
                         style=dict(
                             display="flex",
                             justifyContent="space-between",
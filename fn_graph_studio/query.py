@@ -0,0 +1,285 @@
+"""
+DataFrame queries for the external studio.
+
+Query results are cached per result and query string. Top level conditions
+comparing an indexed column to literals (`==`, `<`, `<=`, `>`, `>=` and `in`)
+are answered from a sorted copy of the column with binary search. Whatever
+else the query says is left to `DataFrame.query`, run on just the rows the
+indexed conditions selected.
+"""
+import ast
+
+from .lru_cache import LRUCache
+
+_FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE}
+
+
+def available_engine():
+    """
+    numexpr when it is installed, which evaluates expressions in vectorized
+    chunks across threads, otherwise pandas' python engine.
+    """
+    try:
+        import numexpr  # noqa: F401
+    except ImportError:
+        return "python"
+    return "numexpr"
+
+
+def _all_strings(values):
+    from pandas.api.types import infer_dtype
+
+    return infer_dtype(values, skipna=True) in ("string", "empty")
+
+
+class SortedIndex:
+    """
+    The non null values of a column in sorted order, with their positions.
+    """
+
+    def __init__(self, column):
+        import numpy as np
+
+        positions = np.flatnonzero(column.notna().to_numpy())
+        values = column.to_numpy()[positions]
+        if values.dtype == object:
+            # Sorting integer codes is far quicker than comparing strings
+            import pandas as pd
+
+            codes, _ = pd.factorize(values, sort=True)
+            order = np.argsort(codes, kind="stable")
+        else:
+            order = np.argsort(values, kind="stable")
+        self.values = values[order]
+        self.positions = positions[order]
+        self.numeric = np.issubdtype(self.values.dtype, np.number)
+        # Object columns mixing strings with other values cannot be searched
+        # with a string
+        self.strings = not self.numeric and _all_strings(self.values)
+
+    def accepts(self, value):
+        if isinstance(value, bool):
+            return False
+        if self.numeric:
+            return isinstance(value, (int, float))
+        return isinstance(value, str) and self.strings
+
+    def bounds(self, op, value):
+        """
+        The slice of the sorted values where `value op value` holds.
+        """
+        search = self.values.searchsorted
+        if op is ast.Eq:
+            return search(value, "left"), search(value, "right")
+        if op is ast.Lt:
+            return 0, search(value, "left")
+        if op is ast.LtE:
+            return 0, search(value, "right")
+        if op is ast.Gt:
+            return search(value, "right"), len(self.values)
+        if op is ast.GtE:
+            return search(value, "left"), len(self.values)
+        raise ValueError(op)
+
+    def select(self, conditions):
+        """
+        The positions of the rows meeting every (operator, values) condition,
+        a condition holds if the column compares true with any of its values.
+
+        The conditions are combined as slices of the sorted values, so e.g. a
+        lower and an upper bound only look at the rows between them.
+        """
+        intervals = [(0, len(self.values))]
+        for op, values in conditions:
+            condition = [self.bounds(op, value) for value in values]
+            intervals = [
+                (max(start, other_start), min(end, other_end))
+                for start, end in intervals
+                for other_start, other_end in condition
+                if max(start, other_start) < min(end, other_end)
+            ]
+        if not intervals:
+            return self.positions[:0]
+
+        import numpy as np
+
+        return np.concatenate([self.positions[start:end] for start, end in intervals])
+
+
+def _conjuncts(node):
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [c for value in node.values for c in _conjuncts(value)]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+        return _conjuncts(node.left) + _conjuncts(node.right)
+    return [node]
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _literal(node.operand)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return -value
+    raise ValueError("Not a literal")
+
+
+def _indexed_condition(node):
+    """
+    The (column, operator, values) of a comparison of a column with literals,
+    or None if the condition is anything else.
+    """
+    if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+        return None
+    left, op, right = node.left, type(node.ops[0]), node.comparators[0]
+    if isinstance(right, ast.Name) and not isinstance(left, ast.Name):
+        left, right = right, left
+        op = _FLIPPED.get(op, op)
+    if not isinstance(left, ast.Name):
+        return None
+
+    try:
+        if op is ast.In and isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+            return left.id, ast.Eq, [_literal(element) for element in right.elts]
+        if op in (ast.Eq, ast.Lt, ast.LtE, ast.Gt, ast.GtE):
+            return left.id, op, [_literal(right)]
+    except ValueError:
+        pass
+    return None
+
+
+class QueryEngine:
+    """
+    Runs and caches `DataFrame.query` calls.
+
+    engine is passed to pandas, "auto" picks numexpr when it is installed.
+    indexes lists the columns to keep sorted indexes of, they are built the
+    first time a result is queried on them.
+    """
+
+    # Above this fraction of the rows an indexed selection is no quicker than
+    # evaluating the condition over the whole column
+    max_selectivity = 0.2
+
+    def __init__(self, engine="auto", indexes=None, cache_size=64):
+        self.engine = available_engine() if engine == "auto" else engine
+        self.indexes = set(indexes or [])
+        self.cache = LRUCache(maxsize=cache_size)
+        self.index_cache = LRUCache(maxsize=cache_size)
+
+    def query(self, frame, expression):
+        return self.cache.get_for_object(
+            frame,
+            lambda frame: self._query(frame, expression),
+            name=("query", expression),
+        )
+
+    def index(self, frame, column):
+        return self.index_cache.get_for_object(
+            frame, lambda frame: SortedIndex(frame[column]), name=("index", column)
+        )
+
+    def _query(self, frame, expression):
+        if not self.indexes:
+            return frame.query(expression, engine=self.engine)
+
+        try:
+            conjuncts = _conjuncts(ast.parse(expression.strip(), mode="eval").body)
+        except SyntaxError:
+            # e.g. backtick quoted column names, which only pandas understands
+            return frame.query(expression, engine=self.engine)
+
+        conditions = {}
+        remaining = []
+        for conjunct in conjuncts:
+            condition = _indexed_condition(conjunct)
+            if condition is not None:
+                column, op, values = condition
+                if column in self.indexes and column in frame.columns:
+                    index = self.index(frame, column)
+                    if all(index.accepts(value) for value in values):
+                        conditions.setdefault(column, []).append((op, values))
+                        continue
+            remaining.append(conjunct)
+
+        if not conditions:
+            return frame.query(expression, engine=self.engine)
+
+        selections = sorted(
+            (self.index(frame, column).select(c) for column, c in conditions.items()),
+            key=len,
+        )
+        if len(selections[0]) > len(frame) * self.max_selectivity:
+            return frame.query(expression, engine=self.engine)
+
+        import numpy as np
+
+        # Narrow the smallest selection down with masks of the others
+        positions = selections[0]
+        for selection in selections[1:]:
+            mask = np.zeros(len(frame), dtype=bool)
+            mask[selection] = True
+            positions = positions[mask[positions]]
+        positions.sort()
+
+        selected = frame.iloc[positions]
+        if remaining:
+            # The conditions are all and-ed, so running the whole query on
+            # the selected rows applies the rest of them
+            selected = selected.query(expression, engine=self.engine)
+        return selected
+
+
+def benchmark_queries(rows=1_000_000, repeat=5, seed=0):
+    """
+    Times the plain `DataFrame.query` path against the query engine, cold,
+    cached and with indexes, on a synthetic frame.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from .benchmarks import time_call
+
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(
+        dict(
+            merchant_id=rng.choice([f"M{i:04}" for i in range(1000)], rows),
+            amount=rng.exponential(100, rows),
+            day=rng.integers(0, 365, rows),
+        )
+    )
+    queries = [
+        'merchant_id == "M0042"',
+        "amount > 500",
+        'day >= 100 and day < 110 and merchant_id in ["M0001", "M0002"]',
+        "amount > 50 and amount * 2 < 300",
+    ]
+
+    engine = QueryEngine()
+    indexed = QueryEngine(indexes=["merchant_id", "amount", "day"])
+    index_build = time_call(
+        lambda: [SortedIndex(frame[column]) for column in indexed.indexes], 1
+    )
+
+    report = {}
+    for expression in queries:
+        # Indexes are built and results cached by the first call, which is
+        # what the index_build time and the uncached engine time cover
+        indexed._query(frame, expression)
+        engine.query(frame, expression)
+        report[expression] = dict(
+            # The current path, pandas' default engine and no caching
+            pandas_query=time_call(lambda: frame.query(expression), repeat),
+            engine=time_call(lambda: engine._query(frame, expression), repeat),
+            engine_indexed=time_call(
+                lambda: indexed._query(frame, expression), repeat
+            ),
+            engine_cached=time_call(lambda: engine.query(frame, expression), repeat),
+        )
+
+    return dict(
+        rows=rows,
+        engine=engine.engine,
+        index_build=index_build,
+        queries=report,
+    )
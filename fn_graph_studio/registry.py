@@ -0,0 +1,212 @@
+"""
+Serving many composers from one studio, each under its own URL prefix.
+
+Composers given as 'path.to.module:obj' specs are imported on the first
+request for their prefix. A composer that has not been requested for
+idle_seconds is evicted, as are the least recently used composers while the
+estimated size of the in memory caches of all loaded composers is over
+memory_budget bytes. Evicting a composer clears its in memory cache and forgets
+the module it was imported from, so the next request imports it afresh.
+Persistent caches, e.g. the development cache, are left alone.
+"""
+import sys
+import threading
+import time
+from importlib import import_module
+
+from .cache_inspection import value_size
+from .lru_cache import LRUCache
+
+
+def import_composer(spec):
+    """
+    The composer of a 'path.to.module:obj' spec.
+    """
+    module_path, _, obj_path = spec.partition(":")
+    if not obj_path:
+        raise ValueError(f"{spec!r} must be specified as 'path.to.module:obj'")
+    return getattr(import_module(module_path), obj_path)
+
+
+def normalise_prefix(prefix):
+    return "/" + prefix.strip("/")
+
+
+def cache_memory(composer, size_cache=None):
+    """
+    An estimate of the bytes held by the composer's in memory cache.
+    """
+    cache = getattr(composer._cache, "cache", None)
+    if not isinstance(cache, dict):
+        return 0
+    if size_cache is None:
+        return sum(value_size(value) for value in list(cache.values()))
+    return sum(
+        size_cache.get_for_object(value, value_size, name="size")
+        for value in list(cache.values())
+    )
+
+
+class _Entry:
+    def __init__(self, spec):
+        self.spec = spec
+        self.composer = spec if not isinstance(spec, str) else None
+        self.module = None
+        self.last_used = None
+        self.lock = threading.Lock()
+
+
+class ComposerRegistry:
+    """
+    Composers by URL prefix, callable as a studio's get_composer.
+
+    composers maps prefixes to composers, or to specs loaded with load. Paths
+    under no prefix, e.g. "/", get the first composer.
+    """
+
+    def __init__(
+        self,
+        composers,
+        *,
+        load=import_composer,
+        memory_budget=None,
+        idle_seconds=None,
+        check_interval=30,
+        on_evict=None,
+    ):
+        if not composers:
+            raise ValueError("A registry needs at least one composer")
+        self._entries = {
+            normalise_prefix(prefix): _Entry(spec) for prefix, spec in composers.items()
+        }
+        self.default = next(iter(self._entries))
+        self.load = load
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        # Called with the prefix and composer of every eviction, e.g. so a
+        # studio can drop the results it keeps for the composer
+        self.on_evict = on_evict
+        self.size_cache = LRUCache(maxsize=4096)
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._sweeper = None
+
+    @property
+    def prefixes(self):
+        return list(self._entries)
+
+    def prefix_for(self, path):
+        """
+        The longest prefix the path is under, or the default prefix.
+        """
+        path = normalise_prefix(path or "/")
+        matches = [
+            prefix
+            for prefix in self._entries
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/")
+        ]
+        return max(matches, key=len) if matches else self.default
+
+    def __call__(self, path):
+        prefix = self.prefix_for(path)
+        entry = self._entries[prefix]
+        loaded = False
+        with entry.lock:
+            if entry.composer is None:
+                loaded = True
+                before = set(sys.modules)
+                entry.composer = self.load(entry.spec)
+                module_path = entry.spec.partition(":")[0]
+                if module_path not in before:
+                    entry.module = module_path
+            entry.last_used = time.monotonic()
+            composer = entry.composer
+
+        self._start_sweeper()
+        if loaded or time.monotonic() - self._last_check > self.check_interval:
+            self.enforce_limits(keep=prefix)
+        return composer
+
+    def loaded(self):
+        """
+        The prefixes of the loaded composers, most recently used last.
+        """
+        loaded = [
+            (entry.last_used, prefix)
+            for prefix, entry in self._entries.items()
+            if entry.last_used is not None
+        ]
+        return [prefix for _, prefix in sorted(loaded)]
+
+    def memory(self, prefix):
+        entry = self._entries[prefix]
+        if entry.composer is None:
+            return 0
+        return cache_memory(entry.composer, self.size_cache)
+
+    def evict(self, prefix):
+        """
+        Clears the composer's in memory cache, and unloads it if it was
+        imported by the registry.
+        """
+        entry = self._entries[prefix]
+        with entry.lock:
+            composer = entry.composer
+            if composer is None:
+                return
+            if not hasattr(composer._cache, "cache_root"):
+                composer.cache_clear()
+            if isinstance(entry.spec, str):
+                entry.composer = None
+                if entry.module is not None:
+                    sys.modules.pop(entry.module, None)
+                    entry.module = None
+            entry.last_used = None
+        if self.on_evict is not None:
+            self.on_evict(prefix, composer)
+
+    def enforce_limits(self, keep=None):
+        """
+        Evicts idle composers, then the least recently used ones until the
+        rest are within the memory budget. Returns the evicted prefixes.
+        """
+        with self._lock:
+            self._last_check = time.monotonic()
+            evicted = []
+            if self.idle_seconds is not None:
+                for prefix in self.loaded():
+                    idle = time.monotonic() - self._entries[prefix].last_used
+                    if prefix != keep and idle > self.idle_seconds:
+                        self.evict(prefix)
+                        evicted.append(prefix)
+
+            if self.memory_budget is not None:
+                loaded = self.loaded()
+                sizes = {prefix: self.memory(prefix) for prefix in loaded}
+                total = sum(sizes.values())
+                for prefix in loaded:
+                    if total <= self.memory_budget:
+                        break
+                    if prefix == keep:
+                        continue
+                    self.evict(prefix)
+                    evicted.append(prefix)
+                    total -= sizes[prefix]
+            return evicted
+
+    def _start_sweeper(self):
+        # Idle composers are evicted even when no requests arrive
+        if self._sweeper is not None or self.idle_seconds is None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(
+                    target=self._sweep, name="fn_graph_studio_registry", daemon=True
+                )
+                self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.enforce_limits()
@@ -1,35 +1,196 @@
-from io import BytesIO
-from pprint import pformat
+import base64
+import secrets
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 import dash_core_components as dcc
-import dash_cytoscape as cyto
 import dash_dangerously_set_inner_html
 import dash_html_components as html
-import dash_table
-import matplotlib.artist
-import matplotlib.pylab as plt
-import networkx as nx
-import pandas as pd
-import plotly
-import seaborn.axisgrid
 
+from .figure_rendering import default_figure_pool
+from .formatting import FormattedPages
 from .layout_helpers import Pane, VStack, HStack, Fill, Scroll
 
+# The renderers import the libraries of the types they render lazily, so that
+# a library is only imported when a result of one of its types is first seen.
+
+
+def type_names(typ):
+    """
+    The fully qualified names a type can be registered under.
+    """
+    return [f"{typ.__module__}.{typ.__qualname__}"]
+
+
+class RendererRegistry:
+    """
+    Maps result types to renderers, keyed by fully qualified type name.
+
+    A result is matched against the names of the classes in its method
+    resolution order, most specific first, so neither the registry nor a
+    lookup needs to import the library a type comes from. The renderer found
+    for each type is cached.
+    """
+
+    def __init__(self):
+        self._renderers = {}
+        self._dispatch_cache = {}
+        self._lock = threading.Lock()
+
+    def register(self, types, renderer):
+        """
+        Register a renderer for a type, a fully qualified type name or a list
+        of either. Later registrations override earlier ones.
+        """
+        if not isinstance(types, (list, tuple)):
+            types = [types]
+
+        with self._lock:
+            for typ in types:
+                for name in type_names(typ) if isinstance(typ, type) else [typ]:
+                    self._renderers[name] = renderer
+            self._dispatch_cache.clear()
+
+        return self
+
+    def lookup(self, typ):
+        try:
+            return self._dispatch_cache[typ]
+        except KeyError:
+            pass
+
+        renderer = None
+        for cls in typ.__mro__:
+            for name in type_names(cls):
+                if name in self._renderers:
+                    renderer = self._renderers[name]
+                    break
+            if renderer:
+                break
+
+        with self._lock:
+            self._dispatch_cache[typ] = renderer
+        return renderer
+
+
+class RenderContext:
+    """
+    State shared with the renderers for the duration of a render.
+    """
+
+    def __init__(
+        self,
+        figure_pool=None,
+        figure_format="auto",
+        figure_dpi=100,
+        figure_complexity_threshold=50_000,
+        plotly_max_points=5000,
+        stash=None,
+        preview_cache=None,
+    ):
+        self.figure_pool = figure_pool or default_figure_pool()
+        self.figure_format = figure_format
+        self.figure_dpi = figure_dpi
+        self.figure_complexity_threshold = figure_complexity_threshold
+        self.plotly_max_points = plotly_max_points
+        # Server side store for state the callbacks of rendered components
+        # need later, without a stash the rendered output is static
+        self.stash = stash
+        # Previews of lazy results that are worth keeping across renders
+        self.preview_cache = preview_cache
+        # Renderers report what they produced here, e.g. format and bytes
+        self.stats = {}
+
+    def stash_value(self, value):
+        """
+        Keeps the value server side and returns the token to fetch it with, or
+        None if there is nowhere to keep it.
+        """
+        if self.stash is None:
+            return None
+        token = new_token()
+        self.stash.set(token, value)
+        return token
+
+
+def new_token():
+    # The stash is shared by every session, so tokens must not be guessable
+    return secrets.token_hex(16)
+
+
+_render_context = ContextVar("fn_graph_studio_render_context", default=None)
+
+
+def current_render_context():
+    return _render_context.get() or RenderContext()
+
+
+@contextmanager
+def render_context(context):
+    token = _render_context.set(context)
+    try:
+        yield context
+    finally:
+        _render_context.reset(token)
+
+
+def format_bytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+
 
 def render_dataframe(result):
+    import dash_table
+
     max_length = 5000
     length = len(result)
     width = len(result.columns)
     render_length = max_length // width
     df = result.head(render_length).reset_index()
+
+    token = current_render_context().stash_value(result)
+    view_selector = (
+        dcc.RadioItems(
+            id={"type": "dataframe-view", "token": token},
+            options=[
+                {"label": "Table", "value": "table"},
+                {"label": "Summary", "value": "summary"},
+            ],
+            value="table",
+            inputStyle=dict(marginRight=2),
+            labelStyle=dict(marginRight=10),
+            style=dict(padding="2px", flexGrow=1),
+        )
+        if token
+        else html.Div(style=dict(flexGrow=1))
+    )
+
     return Fill(
         VStack(
             [
-                html.Div(
-                    f"Displaying {render_length:,} of {length:,} rows ({render_length * width:,} of {length * width:,} cells)",
-                    style=dict(fontWeight="bold", textAlign="right", padding="2px"),
+                HStack(
+                    [
+                        view_selector,
+                        html.Div(
+                            f"Displaying {render_length:,} of {length:,} rows ({render_length * width:,} of {length * width:,} cells)",
+                            style=dict(
+                                fontWeight="bold", textAlign="right", padding="2px"
+                            ),
+                        )
+                        if length > max_length
+                        else None,
+                    ]
+                ),
+                Pane(
+                    Scroll(id={"type": "dataframe-summary", "token": token}),
+                    style=dict(flexGrow=1, flexShrink=1, display="none"),
+                    id={"type": "dataframe-summary-holder", "token": token},
                 )
-                if length > max_length
+                if token
                 else None,
                 Pane(
                     Scroll(
@@ -44,6 +205,11 @@ def render_dataframe(result):
                         )
                     ),
                     style=dict(flexGrow=1, flexShrink=1),
+                    **(
+                        dict(id={"type": "dataframe-table-holder", "token": token})
+                        if token
+                        else {}
+                    ),
                 ),
             ],
             style=dict(height="100%"),
@@ -51,32 +217,138 @@ def render_dataframe(result):
     )
 
 
+def _format_statistic(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float):
+        return f"{value:,.4g}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def render_dataframe_summary(profile):
+    header = ["column", "dtype", "nulls", "distinct", "min", "p25", "median"]
+    header += ["p75", "max", "histogram", "top"]
+    style = dict(padding="2px 8px", textAlign="right", whiteSpace="nowrap")
+
+    def row(entry):
+        cells = {
+            **entry,
+            "nulls": f"{entry['nulls']:,} ({entry['null_fraction']:.0%})",
+            "top": (
+                f"{entry['top']} ({entry['top_count']:,})" if "top" in entry else None
+            ),
+        }
+        return html.Tr(
+            [html.Td(_format_statistic(cells.get(key)), style=style) for key in header]
+        )
+
+    note = (
+        f"Profiled from a sample of {profile['sample_rows']:,} of "
+        f"{profile['rows']:,} rows, min and max are exact"
+        if profile["sampled"]
+        else f"Profiled from all {profile['rows']:,} rows"
+    )
+    return html.Div(
+        [
+            html.Div(note, style=dict(color="grey", padding="0.5rem")),
+            html.Table(
+                [html.Tr([html.Th(key, style=style) for key in header])]
+                + [row(entry) for entry in profile["columns"]],
+                style=dict(fontFamily="monospace"),
+            ),
+        ]
+    )
+
+
 def render_plotly(result):
+    context = current_render_context()
+    if context.plotly_max_points:
+        from .decimation import DecimatedFigure
+
+        decimated = DecimatedFigure(result, context.plotly_max_points)
+        if decimated.decimated:
+            figure = decimated.render()
+            shown = sum(
+                len(figure["data"][i]["y"]) for i in decimated.series.keys()
+            )
+            context.stats["note"] = (
+                f"showing {shown:,} of {decimated.total_points:,} points"
+            )
+
+            token = context.stash_value(decimated)
+            if token is None:
+                return dcc.Graph(figure=figure, style=dict(height="100%"))
+            return dcc.Graph(
+                id={"type": "decimated-figure", "token": token},
+                figure=figure,
+                style=dict(height="100%"),
+            )
+
     return dcc.Graph(figure=result, style=dict(height="100%"))
 
 
 def render_object(result):
-    max_length = 10000
-    formatted = pformat(result)
-    length = len(formatted)
-    if length > max_length:
-        formatted = f"Truncated to {max_length:,} characters from {length:,}\n\n{formatted[:max_length]}..."
+    pages = FormattedPages(result, page_size=10000)
+    formatted = pages.text()
+    summary = pages.summary()
+    style = dict(paddingLeft="0.5rem", paddingTop="0.5rem")
+    if summary is None:
+        return html.Pre(formatted, style=style)
 
-    return html.Pre(formatted, style=dict(paddingLeft="0.5rem", paddingTop="0.5rem"))
+    token = current_render_context().stash_value(pages)
+    if token is None:
+        return html.Pre(f"{formatted}...\n\n({summary})", style=style)
+
+    return html.Div(
+        [
+            html.Pre(formatted, id={"type": "object-text", "token": token}, style=style),
+            html.Div(
+                [
+                    html.Span(summary, id={"type": "object-summary", "token": token}),
+                    html.Button(
+                        "Load more",
+                        id={"type": "object-more", "token": token},
+                        style=dict(marginLeft="0.5rem"),
+                    ),
+                ],
+                style=dict(padding="0.5rem", color="grey"),
+            ),
+        ]
+    )
 
 
-def mpl_to_svg(in_fig: matplotlib.artist.Artist):
+def base_figure(in_fig):
     # This normalizes multiple matplotlib artists to the base figure
-    in_fig = in_fig.figure if (hasattr(in_fig, "figure") and in_fig.figure) else in_fig
+    return in_fig.figure if (hasattr(in_fig, "figure") and in_fig.figure) else in_fig
+
+
+def figure_complexity(figure):
+    """
+    Estimates the cost of drawing a figure as a vector image, roughly the
+    number of artists plus the number of points they draw.
+    """
+    import matplotlib.collections
+    import matplotlib.lines
+
+    complexity = 0
+    for artist in figure.findobj():
+        complexity += 1
+        if isinstance(artist, matplotlib.lines.Line2D):
+            complexity += len(artist.get_xdata(orig=False))
+        elif isinstance(artist, matplotlib.collections.Collection):
+            complexity += max(len(artist.get_offsets()), len(artist.get_paths()))
+    return complexity
 
-    out_img = BytesIO()
-    in_fig.savefig(out_img, format="svg")
 
-    # We refresh the plot so we don't get side effects between runs
-    plt.subplots()
+def mpl_to_svg(in_fig):
+    in_fig = base_figure(in_fig)
 
-    out_img.seek(0)  # rewind file
-    svg_doc = out_img.read().decode("utf8")
+    # The pool closes the figure once rendered, so we don't get side effects
+    # between runs
+    svg_doc = current_render_context().figure_pool.render(in_fig, format="svg")
+    svg_doc = svg_doc.decode("utf8")
 
     # This strips out the document declarations
     # This is not my most elegant work
@@ -84,24 +356,207 @@ def mpl_to_svg(in_fig: matplotlib.artist.Artist):
     return svg_tag
 
 
-def render_seaborn(result: seaborn.axisgrid.Grid):
-    svg = mpl_to_svg(result.fig)
-    return html.Div(
-        dash_dangerously_set_inner_html.DangerouslySetInnerHTML(svg),
-        style=dict(display="flex", justifyContent=" center"),
-    )
+def mpl_to_png(in_fig, dpi):
+    in_fig = base_figure(in_fig)
+    return current_render_context().figure_pool.render(in_fig, format="png", dpi=dpi)
 
 
-def render_matplotlib(result):
-    svg = mpl_to_svg(result)
+def render_figure(figure):
+    """
+    Renders a matplotlib figure as inline SVG, or as a PNG if it is too
+    complex to be drawn as a vector image in the browser.
+    """
+    context = current_render_context()
+    format = context.figure_format
+    if format == "auto":
+        complexity = figure_complexity(base_figure(figure))
+        format = "png" if complexity > context.figure_complexity_threshold else "svg"
 
-    return html.Div(
-        dash_dangerously_set_inner_html.DangerouslySetInnerHTML(svg),
-        style=dict(display="flex", justifyContent=" center"),
-    )
+    if format == "png":
+        png = mpl_to_png(figure, context.figure_dpi)
+        context.stats.update(format="png", bytes=len(png))
+        content = html.Img(
+            src="data:image/png;base64," + base64.b64encode(png).decode("ascii"),
+            style=dict(maxWidth="100%"),
+        )
+    else:
+        svg = mpl_to_svg(figure)
+        context.stats.update(format="svg", bytes=len(svg))
+        content = dash_dangerously_set_inner_html.DangerouslySetInnerHTML(svg)
+
+    return html.Div(content, style=dict(display="flex", justifyContent=" center"))
+
+
+def render_ndarray(result):
+    import dash_table
+
+    from . import ndarray_rendering as nd
+
+    if result.ndim == 0 or result.size == 0:
+        return render_object(result)
+
+    context = current_render_context()
+    lazy = nd.is_lazy(result)
+    header = [
+        html.Strong("Shape: "),
+        " × ".join(f"{length:,}" for length in result.shape),
+        html.Strong(" dtype: ", style=dict(marginLeft="1rem")),
+        str(result.dtype),
+        html.Strong(" size: ", style=dict(marginLeft="1rem")),
+        format_bytes(result.nbytes),
+        " (memory mapped)" if lazy else None,
+    ]
+
+    sections = [html.Div(header, style=dict(padding="0.5rem"))]
+
+    if nd.has_statistics(result):
+        statistics = nd.summary_statistics(result)
+        cells = [("NaNs", statistics.get("nan_count"))]
+        if "min" in statistics:
+            cells = [
+                ("min", statistics["min"]),
+                ("max", statistics["max"]),
+                ("mean", statistics["mean"]),
+                *cells,
+                *(
+                    (f"p{percentile}", value)
+                    for percentile, value in statistics["percentiles"].items()
+                ),
+            ]
+        sections.append(
+            html.Table(
+                [
+                    html.Tr([html.Th(name) for name, _ in cells]),
+                    html.Tr([html.Td(f"{value:,.6g}") for _, value in cells]),
+                ],
+                style=dict(margin="0 0.5rem"),
+            )
+        )
+        if statistics["sampled"]:
+            sections.append(
+                html.Div(
+                    f"Statistics estimated from an evenly spaced sample of "
+                    f"{statistics['sample_size']:,} values",
+                    style=dict(color="grey", padding="0 0.5rem"),
+                )
+            )
+            context.stats["note"] = "statistics sampled"
+
+        sections.append(
+            dcc.Graph(figure=nd.preview_figure(result), style=dict(height="350px"))
+        )
+
+    page_size = 50
+    columns, records = nd.table_page(result, 0, page_size)
+    token = context.stash_value(result)
+    if token is None:
+        table = dash_table.DataTable(
+            columns=[{"name": i, "id": i} for i in columns], data=records
+        )
+    else:
+        table = dash_table.DataTable(
+            id={"type": "array-table", "token": token},
+            columns=[{"name": i, "id": i} for i in columns],
+            data=records,
+            page_action="custom",
+            page_current=0,
+            page_size=page_size,
+            page_count=nd.page_count(result, page_size),
+        )
+    sections.append(html.Div(table, style=dict(padding="0.5rem")))
+
+    return html.Div(sections)
+
+
+def render_lazy_frame(result):
+    import dash_table
+
+    from .lazy_frames import cached_preview
+
+    context = current_render_context()
+    preview = cached_preview(context.preview_cache, result)
+
+    if preview.rows is None:
+        rows = "unknown number of rows"
+    elif preview.rows_exact:
+        rows = f"{preview.rows:,} rows"
+    else:
+        rows = f"about {preview.rows:,} rows (estimated from the first partition)"
+
+    head = preview.head.reset_index()
+    sections = [
+        html.Div(
+            [
+                html.Strong(preview.kind),
+                f" with {len(preview.schema):,} columns, {rows}, in "
+                f"{preview.partitions:,} partition"
+                + ("" if preview.partitions == 1 else "s"),
+            ],
+            style=dict(padding="0.5rem"),
+        ),
+        html.Details(
+            [
+                html.Summary("Schema"),
+                html.Table(
+                    [html.Tr([html.Th("Column"), html.Th("Type")])]
+                    + [
+                        html.Tr([html.Td(name), html.Td(type_)])
+                        for name, type_ in preview.schema
+                    ]
+                ),
+            ],
+            style=dict(padding="0 0.5rem 0.5rem 0.5rem"),
+        ),
+        html.Div(
+            f"First {len(head):,} rows",
+            style=dict(fontWeight="bold", padding="0 0.5rem"),
+        ),
+        html.Div(
+            dash_table.DataTable(
+                columns=[{"name": str(i), "id": str(i)} for i in head.columns],
+                data=head.rename(columns=str).to_dict("records"),
+            ),
+            style=dict(padding="0.5rem"),
+        ),
+    ]
+
+    token = context.stash_value(result)
+    if token is not None:
+        sections.append(
+            html.Div(
+                [
+                    html.Button(
+                        "Count rows", id={"type": "lazy-frame-count", "token": token}
+                    ),
+                    html.Button(
+                        "Load into pandas",
+                        id={"type": "lazy-frame-load", "token": token},
+                        style=dict(marginLeft="0.5rem"),
+                    ),
+                    html.Span(
+                        " Both read the whole result",
+                        style=dict(color="grey", marginLeft="0.5rem"),
+                    ),
+                ],
+                style=dict(padding="0.5rem"),
+            )
+        )
+        sections.append(html.Div(id={"type": "lazy-frame-detail", "token": token}))
+
+    return html.Div(sections)
+
+
+def render_seaborn(result):
+    return render_figure(result.fig)
+
+
+def render_matplotlib(result):
+    return render_figure(result)
 
 
 def render_networkx(G):
+    import dash_cytoscape as cyto
+
     nodes = [{"data": {"id": node, "label": node}} for node in G.nodes()]
     edges = [{"data": {"source": f, "target": t}} for (f, t) in G.edges()]
 
@@ -115,13 +570,39 @@ def render_networkx(G):
     )
 
 
+def default_renderers():
+    return (
+        RendererRegistry()
+        .register("builtins.object", render_object)
+        .register(
+            # Pandas exposes DataFrame as pandas.DataFrame from version 3
+            ["pandas.core.frame.DataFrame", "pandas.DataFrame"],
+            render_dataframe,
+        )
+        .register("plotly.basedatatypes.BaseFigure", render_plotly)
+        .register("matplotlib.artist.Artist", render_matplotlib)
+        .register("seaborn.axisgrid.Grid", render_seaborn)
+        .register("networkx.classes.graph.Graph", render_networkx)
+        .register("numpy.ndarray", render_ndarray)
+        .register(
+            [
+                "dask.dataframe.dask_expr._collection.DataFrame",
+                # Dask before the move to dask-expr
+                "dask.dataframe.core.DataFrame",
+                "pyarrow.lib.Table",
+                "pyarrow._dataset.Dataset",
+            ],
+            render_lazy_frame,
+        )
+    )
+
+
 def add_default_renderers(renderers):
-    return [
-        *(renderers or {}).items(),
-        (pd.DataFrame, render_dataframe),
-        (plotly.graph_objs.Figure, render_plotly),
-        (matplotlib.artist.Artist, render_matplotlib),
-        (seaborn.axisgrid.Grid, render_seaborn),
-        (nx.Graph, render_networkx),
-        (object, render_object),
-    ]
+    """
+    The default renderers, along with any extra renderers given as a
+    dictionary of type (or fully qualified type name) to render function.
+    """
+    registry = default_renderers()
+    for typ, render in (renderers or {}).items():
+        registry.register(typ, render)
+    return registry
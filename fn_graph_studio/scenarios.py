@@ -0,0 +1,132 @@
+"""
+Comparing the results of a node under several named parameter sets.
+
+Everything upstream of the node that none of the differing parameters affect
+is calculated once and shared by every scenario, the rest is calculated for
+each scenario at the same time.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from fn_graph.calculation import calculate_collect_exceptions
+
+from .sweep import SweepCache, shared_nodes, with_shared_results
+
+
+def differing_parameters(scenarios):
+    """
+    The parameters whose values are not the same in every scenario.
+    """
+    names = set().union(*scenarios.values())
+    return {
+        name
+        for name in names
+        if len({repr(values.get(name)) for values in scenarios.values()}) > 1
+    }
+
+
+def calculate_scenarios(composer, function_name, scenarios, progress_callback=None):
+    """
+    The result and exception info of the function for each scenario, a
+    dictionary of parameter values applied to the composer.
+
+    progress_callback is called by the calculation of the shared nodes, which
+    goes through the composer's cache, the scenarios have a cache of their own.
+    """
+    differing = differing_parameters(scenarios)
+    base = composer.update_parameters(**next(iter(scenarios.values())))
+
+    shared = {}
+    names = shared_nodes(base, [function_name], differing)
+    if names:
+        shared, exception_info = calculate_collect_exceptions(
+            base, sorted(names), progress_callback=progress_callback
+        )
+        if exception_info:
+            return {name: (None, exception_info) for name in scenarios}
+
+    scenario_composer = with_shared_results(base, shared)
+    scenario_composer = scenario_composer.cache(
+        SweepCache(scenario_composer, differing)
+    )
+
+    def calculate(parameters):
+        results, exception_info = calculate_collect_exceptions(
+            scenario_composer.update_parameters(**parameters), [function_name]
+        )
+        return results.get(function_name), exception_info
+
+    with ThreadPoolExecutor(max_workers=len(scenarios)) as pool:
+        futures = {
+            name: pool.submit(calculate, parameters)
+            for name, parameters in scenarios.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def _equal(base, other):
+    try:
+        equal = base == other
+    except TypeError:
+        # e.g. categoricals with different categories
+        equal = base.astype(object) == other.astype(object)
+    return equal | (base.isna() & other.isna())
+
+
+def dataframe_diff(base, other, max_rows=1000):
+    """
+    The differences between two DataFrames, aligned on their index and
+    columns: counts of the rows that changed, were added and were removed, and
+    a frame of the changed rows and columns. Numeric columns show the change
+    in value, others show the old and new values of changed cells.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not (base.index.is_unique and other.index.is_unique):
+        # Duplicate labels cannot be aligned, compare by position
+        base, other = base.reset_index(drop=True), other.reset_index(drop=True)
+
+    added = other.index.difference(base.index)
+    removed = base.index.difference(other.index)
+    base, other = base.align(other, join="outer")
+
+    equal = _equal(base, other)
+    changed_rows = ~equal.all(axis=1)
+    changed_columns = list(equal.columns[~equal.all(axis=0)])
+
+    rows = changed_rows.to_numpy().nonzero()[0][:max_rows]
+    labels = base.index[rows]
+    # Added and removed rows have no old or new values, rather than NaNs
+    is_added, is_removed = labels.isin(added), labels.isin(removed)
+    missing = is_added | is_removed
+    diff = {}
+    for column in changed_columns:
+        old, new = base[column].iloc[rows], other[column].iloc[rows]
+        values = (
+            old.astype(str).mask(is_added, "∅")
+            + " → "
+            + new.astype(str).mask(is_removed, "∅")
+        )
+        if (
+            pd.api.types.is_numeric_dtype(old)
+            and pd.api.types.is_numeric_dtype(new)
+            and not pd.api.types.is_bool_dtype(old)
+        ):
+            difference = new - old
+            diff[column] = (
+                difference.astype(object).mask(missing, values)
+                if missing.any()
+                else difference
+            )
+        else:
+            changed = ~equal[column].iloc[rows].to_numpy() | missing
+            diff[column] = np.where(changed, values, "")
+
+    return dict(
+        rows=len(base),
+        changed_rows=int(changed_rows.sum()),
+        changed_columns=changed_columns,
+        added_rows=len(added),
+        removed_rows=len(removed),
+        frame=pd.DataFrame(diff, index=labels),
+    )
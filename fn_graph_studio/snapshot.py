@@ -0,0 +1,312 @@
+"""
+Snapshots: the results of a composer for fixed parameters, exported to a
+directory that the studio serves without calculating anything.
+
+Exporting calculates the chosen nodes, and everything they depend on, in
+parallel, then writes each result to a file: DataFrames as uncompressed Arrow
+IPC files and numpy arrays as .npy files, both of which are memory mapped when
+read, and anything else pickled. Each result is also rendered by the default
+renderers, without a stash so the output is static, and the rendered
+components are written as JSON. The shape of the graph and the source of every
+function are kept in the manifest.
+
+Serving a snapshot rebuilds the composer from the manifest, with functions
+that refuse to run and a cache that holds every exported result, so the
+studio only ever reads results. Nodes that failed to calculate raise their
+original error.
+"""
+
+import inspect
+import json
+import pickle
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from fn_graph import Composer
+from fn_graph.caches import NullCache, SimpleCache
+
+from .lru_cache import LRUCache
+from .result_renderers import RenderContext, add_default_renderers, render_context
+from .warming import Warming, warm_nodes
+
+MANIFEST = "manifest.json"
+
+_missing = object()
+
+
+def write_value(directory, node, value):
+    """
+    Writes the value to a file of the directory, returning the file name and
+    its format.
+    """
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(value, pandas.DataFrame):
+        try:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(value)
+            path = directory / f"{node}.arrow"
+            with pa.OSFile(str(path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            return path.name, "arrow"
+        except Exception:
+            # e.g. pyarrow is not installed, or the columns are not strings
+            pass
+
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        if not value.dtype.hasobject:
+            path = directory / f"{node}.npy"
+            numpy.save(path, value, allow_pickle=False)
+            return path.name, "npy"
+
+    path = directory / f"{node}.pickle"
+    with open(path, "wb") as f:
+        pickle.dump(value, f)
+    return path.name, "pickle"
+
+
+def read_value(path, format):
+    if format == "arrow":
+        import pyarrow as pa
+
+        return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all().to_pandas()
+    if format == "npy":
+        import numpy as np
+
+        return np.load(path, mmap_mode="r")
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def render_static(renderers, value, figure_format="auto"):
+    """
+    The value rendered as JSON, and what the renderer reported about it.
+    """
+    import plotly
+
+    render = renderers.lookup(type(value))
+    if render is None:
+        return None, {}
+    context = RenderContext(figure_format=figure_format)
+    with render_context(context):
+        rendered = render(value)
+    return json.dumps(rendered, cls=plotly.utils.PlotlyJSONEncoder), context.stats
+
+
+def signature_spec(fn):
+    return [
+        [name, parameter.kind.name, parameter.default is not parameter.empty]
+        for name, parameter in inspect.signature(fn).parameters.items()
+    ]
+
+
+def _source(composer, node):
+    try:
+        return composer.get_source(node)
+    except Exception as e:
+        return f"# The source of {node} is not available: {e}"
+
+
+def _export_node(composer, directory, renderers, figure_format, node):
+    entry = dict(type=None, file=None, format=None, rendered=None, stats={})
+    try:
+        value = composer._cache.get(composer, node)
+        entry["type"] = str(type(value))
+        entry["file"], entry["format"] = write_value(directory / "data", node, value)
+    except Exception as e:
+        entry["error"] = f"Could not be written: {type(e).__name__}: {e}"
+        return entry
+
+    try:
+        rendered, stats = render_static(renderers, value, figure_format)
+    except Exception:
+        # Served by rendering the data instead
+        return entry
+    if rendered is not None:
+        entry["rendered"] = f"{node}.json"
+        entry["stats"] = stats
+        with open(directory / "rendered" / entry["rendered"], "w") as f:
+            f.write(rendered)
+    return entry
+
+
+def export_snapshot(
+    composer,
+    directory,
+    nodes=None,
+    parameters=None,
+    workers=4,
+    renderers=None,
+    figure_format="auto",
+    progress=None,
+):
+    """
+    Exports the results of the nodes (every node if None), and everything
+    they depend on, to the directory, and returns the manifest.
+
+    The composer's cache is used when it has one, otherwise the results are
+    held in memory until they are written. progress(warming) is called as
+    nodes are calculated.
+    """
+    if parameters:
+        composer = composer.update_parameters(**parameters)
+    if type(composer._cache) is NullCache:
+        composer = composer.cache(SimpleCache())
+
+    directory = Path(directory)
+    (directory / "data").mkdir(parents=True, exist_ok=True)
+    (directory / "rendered").mkdir(exist_ok=True)
+    started = time.perf_counter()
+
+    warming = Warming(composer, warm_nodes(composer, nodes), workers=workers)
+    warming.run(progress)
+
+    renderers = add_default_renderers(renderers)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            node: pool.submit(
+                _export_node, composer, directory, renderers, figure_format, node
+            )
+            for node in warming.done
+        }
+        entries = {node: future.result() for node, future in futures.items()}
+    for node, error in warming.failed.items():
+        entries[node] = dict(error=error)
+    for node in warming.skipped:
+        entries[node] = dict(error="Not calculated, a node it depends on failed")
+
+    exported = set(warming.plan)
+    with open(directory / "parameters.pickle", "wb") as f:
+        pickle.dump(
+            {
+                name: value
+                for name, value in composer._parameters.items()
+                if name in exported and "error" not in entries[name]
+            },
+            f,
+        )
+
+    manifest = dict(
+        created=time.time(),
+        seconds=time.perf_counter() - started,
+        figure_format=figure_format,
+        parameters={
+            name: repr(value)
+            for name, (_, value) in composer._parameters.items()
+            if name in exported
+        },
+        nodes=entries,
+        signatures={
+            node: signature_spec(fn)
+            for node, fn in composer._functions.items()
+            if node in exported and node not in composer._parameters
+        },
+        sources={node: _source(composer, node) for node in sorted(exported)},
+    )
+    with open(directory / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2, default=repr)
+    return manifest
+
+
+def _stub(node, spec, error):
+    def function(*args, **kwargs):
+        raise RuntimeError(error or f"{node} is not in the snapshot")
+
+    function.__name__ = node.split("__")[-1]
+    function.__signature__ = inspect.Signature(
+        [
+            inspect.Parameter(
+                name,
+                getattr(inspect.Parameter, kind),
+                default=None if has_default else inspect.Parameter.empty,
+            )
+            for name, kind, has_default in spec
+        ]
+    )
+    return function
+
+
+class SnapshotCache(NullCache):
+    """
+    Answers every exported node from the snapshot, and never stores anything.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def valid(self, composer, key):
+        return self.snapshot.has_result(key)
+
+    def get(self, composer, key):
+        return self.snapshot.load(key)
+
+
+class Snapshot:
+    """
+    An exported snapshot. Loaded results and rendered components are kept in
+    memory, up to cache_size of each.
+    """
+
+    def __init__(self, directory, cache_size=64):
+        self.directory = Path(directory)
+        with open(self.directory / MANIFEST) as f:
+            self.manifest = json.load(f)
+        self.nodes = self.manifest["nodes"]
+        self.results = LRUCache(maxsize=cache_size)
+        self.rendered_results = LRUCache(maxsize=cache_size)
+
+    def has_result(self, node):
+        return self.nodes.get(node, {}).get("file") is not None
+
+    def load(self, node):
+        result = self.results.get(node, _missing)
+        if result is _missing:
+            entry = self.nodes[node]
+            result = read_value(
+                self.directory / "data" / entry["file"], entry["format"]
+            )
+            self.results.set(node, result)
+        return result
+
+    def rendered(self, node):
+        """
+        The pre-rendered components of the node's result, None if it has none.
+        """
+        name = self.nodes.get(node, {}).get("rendered")
+        if name is None:
+            return None
+        rendered = self.rendered_results.get(node)
+        if rendered is None:
+            with open(self.directory / "rendered" / name) as f:
+                rendered = json.load(f)
+            self.rendered_results.set(node, rendered)
+        return rendered
+
+    def composer(self):
+        """
+        A composer with the graph, sources and parameters of the snapshot,
+        whose functions only raise and whose cache is the snapshot.
+        """
+        with open(self.directory / "parameters.pickle", "rb") as f:
+            parameters = pickle.load(f)
+
+        functions = {
+            node: _stub(
+                node,
+                self.manifest["signatures"].get(node, []),
+                self.nodes.get(node, {}).get("error"),
+            )
+            for node in self.manifest["sources"]
+            if node not in parameters
+        }
+        return (
+            Composer()
+            .update(**functions)
+            .update_parameters(**parameters)
+            .set_source_map(self.manifest["sources"])
+            .cache(SnapshotCache(self))
+        )
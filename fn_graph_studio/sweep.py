@@ -0,0 +1,272 @@
+"""
+Headless calculation of nodes across a grid of parameter values.
+
+Each point of the grid is calculated with a cache keyed by the values of the
+swept parameters each node depends on, so a node is only calculated once for
+every combination of the parameters that actually affect it. Nodes no swept
+parameter affects are calculated once, up front, and handed to every worker.
+
+Points differing only in their last parameter are calculated by the same
+worker, so list the parameters feeding expensive nodes first. The composer's
+own cache is not used, as it holds a single result per node, not one per
+point.
+"""
+import itertools
+import json
+import math
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import networkx as nx
+from fn_graph.caches import NullCache
+from fn_graph.calculation import calculate_collect_exceptions
+from fn_graph.profiler import Profiler
+
+
+def parse_value(type_, raw):
+    """
+    A parameter value given on the command line, cast to the parameter's type.
+    """
+    if type_ is bool:
+        return raw.strip().lower() in ("1", "t", "true", "y", "yes")
+    if type_ in (int, float, str):
+        return type_(raw)
+    return json.loads(raw)
+
+
+def grid_points(grid):
+    """
+    Every combination of the values of a {parameter: [values]} grid.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+class SweepCache(NullCache):
+    """
+    Results keyed by the node and the values of the swept parameters it
+    depends on. Nodes that depend on every swept parameter differ at every
+    point, so they are not kept.
+    """
+
+    def __init__(self, composer, swept):
+        dag = composer.dag()
+        self.swept = frozenset(swept)
+        self.relevant = {
+            node: frozenset((nx.ancestors(dag, node) | {node}) & self.swept)
+            for node in dag
+        }
+        self.results = {}
+
+    def _key(self, composer, node):
+        names = self.relevant.get(node)
+        if names is None or (names == self.swept and names):
+            return None
+        values = tuple(
+            (name, repr(composer._parameters[name][1])) for name in sorted(names)
+        )
+        return node, values
+
+    def valid(self, composer, key):
+        return self._key(composer, key) in self.results
+
+    def get(self, composer, key):
+        return self.results[self._key(composer, key)]
+
+    def set(self, composer, key, value):
+        cache_key = self._key(composer, key)
+        if cache_key is not None:
+            self.results[cache_key] = value
+
+    def invalidate(self, composer, key):
+        self.results.pop(self._key(composer, key), None)
+
+
+def shared_nodes(composer, nodes, swept):
+    """
+    The functions needed for the nodes that no swept parameter affects and
+    that feed a node that one does, or are asked for themselves.
+    """
+    dag = composer.ancestor_dag(nodes)
+    affected = set(swept)
+    for name in swept:
+        if name in dag:
+            affected.update(nx.descendants(dag, name))
+
+    return {
+        node
+        for node in dag
+        if node not in affected
+        and node not in composer.parameters()
+        and (node in nodes or any(succ in affected for succ in dag.successors(node)))
+    }
+
+
+def _constant(value):
+    def constant():
+        return value
+
+    return constant
+
+
+def with_shared_results(composer, shared):
+    """
+    The composer with the functions of the shared {node: result} replaced by
+    their results, which cuts everything upstream of them out of calculations.
+    """
+    if not shared:
+        return composer
+    return composer.update(**{node: _constant(value) for node, value in shared.items()})
+
+
+_worker = {}
+
+
+def _initialise(load, spec, nodes, swept, shared):
+    composer = with_shared_results(load(spec), shared)
+    _worker.update(composer=composer.cache(SweepCache(composer, swept)), nodes=nodes)
+
+
+def write_result(directory, node, value):
+    if hasattr(value, "to_parquet"):
+        path = directory / f"{node}.parquet"
+        try:
+            value.to_parquet(path)
+            return path.name
+        except Exception:
+            path.unlink(missing_ok=True)
+
+    path = directory / f"{node}.pickle"
+    with open(path, "wb") as f:
+        pickle.dump(value, f)
+    return path.name
+
+
+def _run_points(points, output_dir):
+    summaries = []
+    for index, parameters in points:
+        composer = _worker["composer"].update_parameters(**parameters)
+        profiler = Profiler()
+        start = time.perf_counter()
+        results, exception_info = calculate_collect_exceptions(
+            composer, _worker["nodes"], progress_callback=profiler
+        )
+        seconds = time.perf_counter() - start
+
+        directory = Path(output_dir) / f"point-{index:05}"
+        directory.mkdir(parents=True, exist_ok=True)
+        files = {
+            node: write_result(directory, node, results[node])
+            for node in _worker["nodes"]
+            if node in results
+        }
+        with open(directory / "profile.json", "w") as f:
+            json.dump(profiler.results(), f, indent=2)
+
+        summary = dict(
+            index=index,
+            parameters=parameters,
+            seconds=seconds,
+            directory=directory.name,
+            files=files,
+        )
+        if exception_info:
+            etype, evalue, _, node = exception_info
+            summary.update(error=f"{etype.__name__}: {evalue}", failed_node=node)
+        summaries.append(summary)
+    return summaries
+
+
+def point_chunks(indexed, workers):
+    """
+    Splits the (index, point) pairs into the chunks sent to each worker.
+
+    Points that differ only in their last parameter go to the same worker,
+    where everything depending on the others is reused, unless that would
+    leave workers idle.
+    """
+    groups = {}
+    for index, point in indexed:
+        key = tuple((name, repr(value)) for name, value in list(point.items())[:-1])
+        groups.setdefault(key, []).append((index, point))
+    chunks = list(groups.values())
+
+    if len(chunks) < workers:
+        size = max(1, math.ceil(len(indexed) / workers))
+        chunks = [
+            chunk[i : i + size] for chunk in chunks for i in range(0, len(chunk), size)
+        ]
+    return chunks
+
+
+def run_sweep(load, spec, nodes, points, output_dir, workers=4, progress=None):
+    """
+    Calculates the nodes at every point, a dictionary of parameter values,
+    writing the results and profile of each point to a directory of
+    output_dir, and a manifest.json summarising the sweep.
+
+    load(spec) loads the composer, it is called again in every worker
+    process. With no workers the points are calculated in this process.
+    progress(summaries) is called as points finish.
+    """
+    composer = load(spec)
+    points = points or [{}]
+    swept = set().union(*points)
+
+    unknown = swept - set(composer.parameters())
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    missing = set(nodes) - set(composer.dag())
+    if missing:
+        raise ValueError(f"Unknown nodes: {', '.join(sorted(missing))}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    shared = {}
+    if workers and len(points) > 1:
+        names = shared_nodes(composer, nodes, swept)
+        if names:
+            shared, exception_info = calculate_collect_exceptions(
+                composer, sorted(names)
+            )
+            if exception_info:
+                etype, evalue, _, node = exception_info
+                raise RuntimeError(f"{node}: {etype.__name__}: {evalue}")
+
+    indexed = list(enumerate(points))
+    summaries = []
+    if not workers:
+        _initialise(load, spec, list(nodes), swept, shared)
+        for point in indexed:
+            summaries.extend(_run_points([point], output_dir))
+            if progress:
+                progress(summaries[-1:])
+    else:
+        chunks = point_chunks(indexed, workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_initialise,
+            initargs=(load, spec, list(nodes), swept, shared),
+        ) as pool:
+            futures = [pool.submit(_run_points, chunk, output_dir) for chunk in chunks]
+            for future in as_completed(futures):
+                finished = future.result()
+                summaries.extend(finished)
+                if progress:
+                    progress(finished)
+
+    summaries.sort(key=lambda summary: summary["index"])
+    manifest = dict(
+        composer=spec,
+        nodes=list(nodes),
+        shared=sorted(shared),
+        seconds=time.perf_counter() - started,
+        points=summaries,
+    )
+    with open(output_dir / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2, default=repr)
+    return manifest
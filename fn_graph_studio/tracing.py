@@ -0,0 +1,276 @@
+"""
+Per-request tracing for the studio.
+
+Each dash request becomes a trace made up of spans for the callback, the
+steps it takes (parameter updates, every node executed, rendering) and the
+response encoding. Finished traces are kept in memory, or when a directory is
+given appended to a file there as Zipkin v2 JSON spans, one span per line,
+with requests slower than a threshold also written to a slow request log.
+Only traces that began in a request are written, not e.g. those of warming.
+"""
+
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from logging import getLogger
+from pathlib import Path
+
+import flask
+from fn_graph.calculation import NodeInstruction
+
+log = getLogger(__name__)
+
+DEFAULT_TRACE_DIR = ".fn_graph_studio"
+
+_current_span = ContextVar("fn_graph_studio_current_span", default=None)
+
+CACHE_STATUS = {
+    NodeInstruction.CALCULATE: "miss",
+    NodeInstruction.RETRIEVE: "hit",
+    NodeInstruction.IGNORE: "skipped",
+}
+
+
+def chain_callbacks(*callbacks):
+    """
+    Combines several calculation progress callbacks into one.
+    """
+    callbacks = [callback for callback in callbacks if callback]
+
+    def callback(event_type, details):
+        for cb in callbacks:
+            cb(event_type, details)
+
+    return callback
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes, start=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.span_id = secrets.token_hex(8)
+        self.attributes = dict(attributes)
+        self.start = start or time.time()
+        self.duration = None
+        self.in_request = flask.has_request_context()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_zipkin(self):
+        span = dict(
+            traceId=self.trace_id,
+            id=self.span_id,
+            name=self.name,
+            timestamp=int(self.start * 1e6),
+            duration=max(int((self.duration or 0) * 1e6), 1),
+            localEndpoint=dict(serviceName="fn_graph_studio"),
+            tags={key: str(value) for key, value in self.attributes.items()},
+        )
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        return span
+
+
+class Tracer:
+    """
+    Collects spans into traces and, given a directory, writes each trace that
+    began in a request out once its root span finishes.
+    """
+
+    def __init__(
+        self,
+        directory=None,
+        slow_threshold=2.0,
+        max_bytes=50_000_000,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.slow_threshold = slow_threshold
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._traces = {}
+
+    @property
+    def trace_path(self):
+        return self.directory / "traces.jsonl"
+
+    @property
+    def slow_log_path(self):
+        return self.directory / "slow_requests.log"
+
+    def current_span(self):
+        return _current_span.get()
+
+    def start_span(self, name, parent=None, start=None, **attributes):
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        span = Span(
+            name, trace_id, parent.span_id if parent else None, attributes, start
+        )
+        with self._lock:
+            self._traces.setdefault(trace_id, []).append(span)
+        return span
+
+    def finish_span(self, span, end=None):
+        span.duration = (end or time.time()) - span.start
+        if span.parent_id is None:
+            with self._lock:
+                spans = self._traces.pop(span.trace_id, [])
+            if span.in_request:
+                self._write_trace(span, spans)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        A child span of the current span, or a new trace if there is none.
+        """
+        span = self.start_span(name, parent=_current_span.get(), **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish_span(span)
+
+    def calculation_callback(self):
+        """
+        A progress callback for `calculate_collect_exceptions` that records a
+        span for every node that is executed.
+        """
+        parent = _current_span.get()
+        open_spans = {}
+
+        def callback(event_type, details):
+            if parent is None:
+                return
+
+            if event_type == "start_step":
+                instruction = details["execution_instruction"]
+                open_spans[details["name"]] = self.start_span(
+                    details["name"],
+                    parent=parent,
+                    node=details["name"],
+                    cache=CACHE_STATUS[instruction],
+                )
+            elif event_type == "end_step":
+                span = open_spans.pop(details["name"], None)
+                if span:
+                    self.finish_span(span)
+
+        return callback
+
+    def instrument(self, fn, name=None):
+        """
+        Wraps a callback in a span.
+        """
+        name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                with self.span("callback", callback=name):
+                    return fn(*args, **kwargs)
+            finally:
+                if flask.has_request_context():
+                    flask.g.studio_callback_end = time.time()
+
+        return wrapper
+
+    def _write_trace(self, root, spans):
+        slow = root.duration >= self.slow_threshold
+        if slow:
+            log.warning(
+                "Slow request %s took %.3fs (trace %s)",
+                root.attributes.get("output", root.name),
+                root.duration,
+                root.trace_id,
+            )
+
+        if self.directory is None:
+            return
+
+        lines = "".join(json.dumps(span.to_zipkin()) + "\n" for span in spans)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._append(self.trace_path, lines)
+            if slow:
+                self._append(
+                    self.slow_log_path,
+                    f"{datetime.fromtimestamp(root.start).isoformat()} "
+                    f"{root.duration:.3f}s trace={root.trace_id} "
+                    f"output={root.attributes.get('output', '')}\n",
+                )
+
+    def _append(self, path, text):
+        if path.exists() and path.stat().st_size > self.max_bytes:
+            path.replace(path.with_name(path.name + ".1"))
+        with open(path, "a") as f:
+            f.write(text)
+
+
+def install_tracing(server, tracer):
+    """
+    Starts a trace for every dash callback request, and records the response
+    encoding as a span once the response is ready.
+    """
+
+    # Several studios can share a server, only install once
+    if getattr(server, "_studio_tracer", None) is not None:
+        return
+    server._studio_tracer = tracer
+
+    @server.before_request
+    def start_trace():
+        if not flask.request.path.endswith("_dash-update-component"):
+            return
+        body = flask.request.get_json(silent=True) or {}
+        root = tracer.start_span(
+            "dash_request",
+            output=body.get("output", ""),
+            triggered=",".join(body.get("changedPropIds") or []),
+        )
+        flask.g.studio_trace = (root, _current_span.set(root))
+
+    @server.after_request
+    def finish_trace(response):
+        trace = flask.g.pop("studio_trace", None)
+        if trace:
+            root, token = trace
+            _current_span.reset(token)
+            callback_end = flask.g.pop("studio_callback_end", None)
+            if callback_end:
+                encoding = tracer.start_span(
+                    "response_encoding", parent=root, start=callback_end
+                )
+                tracer.finish_span(encoding)
+            root.set(status=response.status_code, bytes_out=len(response.get_data()))
+            tracer.finish_span(root)
+        return response
+
+
+def read_traces(path, around, window=60):
+    """
+    Returns the spans of every trace whose root started within `window`
+    seconds of the `around` datetime, grouped by trace id.
+    """
+    start = (around.timestamp() - window) * 1e6
+    end = (around.timestamp() + window) * 1e6
+
+    traces = {}
+    matching = set()
+    with open(path) as f:
+        for line in f:
+            span = json.loads(line)
+            traces.setdefault(span["traceId"], []).append(span)
+            if "parentId" not in span and start <= span["timestamp"] <= end:
+                matching.add(span["traceId"])
+
+    return {trace_id: traces[trace_id] for trace_id in traces if trace_id in matching}
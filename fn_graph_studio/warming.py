@@ -0,0 +1,135 @@
+"""
+Warming a composer's cache ahead of its users.
+
+Each node is calculated on its own once every node it depends on has been, so
+the calculation of a node only retrieves its inputs from the cache and runs
+its own function. Nodes are run across a pool of threads, in dependency order,
+so independent branches of the graph are calculated at the same time. Threads
+rather than processes are used so in memory caches are populated too. If a
+node fails the nodes depending on it are skipped.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import networkx as nx
+from fn_graph.caches import NullCache
+from fn_graph.calculation import calculate_collect_exceptions
+
+
+def warm_nodes(composer, nodes=None, descendants=False):
+    """
+    The nodes to calculate to warm the given nodes: the nodes themselves,
+    their descendants if asked for, and everything they depend on. Every node
+    if nodes is None.
+    """
+    dag = composer.dag()
+    if nodes is None:
+        return set(dag)
+
+    targets = {node for node in nodes if node in dag}
+    if descendants:
+        for node in list(targets):
+            targets.update(nx.descendants(dag, node))
+    for node in list(targets):
+        targets.update(nx.ancestors(dag, node))
+    return targets
+
+
+class Warming:
+    """
+    A warming of the given nodes of the composer.
+
+    progress_callback is passed to the calculation of every node.
+    """
+
+    def __init__(self, composer, nodes, workers=4, progress_callback=None):
+        if type(composer._cache) is NullCache:
+            raise ValueError("The composer has no cache to warm, see Composer.cache")
+
+        self.composer = composer
+        self.plan = composer.dag().subgraph(nodes)
+        self.workers = workers
+        self.progress_callback = progress_callback
+        self.done = []
+        self.failed = {}
+        self.skipped = set()
+        self.running = set()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.plan)
+
+    def _calculate(self, node):
+        with self._lock:
+            self.running.add(node)
+        try:
+            _, exception_info = calculate_collect_exceptions(
+                self.composer, [node], progress_callback=self.progress_callback
+            )
+        except Exception as e:
+            # e.g. the cache failing to store the result
+            return f"{type(e).__name__}: {e}"
+        finally:
+            with self._lock:
+                self.running.discard(node)
+        if exception_info:
+            etype, evalue, _, _ = exception_info
+            return f"{etype.__name__}: {evalue}"
+        return None
+
+    def run(self, progress=None):
+        """
+        Calculates every node, calling progress(self) after each one.
+        """
+        self.started = time.time()
+        waiting = {node: self.plan.in_degree(node) for node in self.plan}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+
+            def submit(node):
+                futures[pool.submit(self._calculate, node)] = node
+
+            for node, count in waiting.items():
+                if count == 0:
+                    submit(node)
+
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = futures.pop(future)
+                    error = future.result()
+                    with self._lock:
+                        if error:
+                            self.failed[node] = error
+                            # Nothing depending on it is submitted, as its
+                            # successors are left waiting
+                            self.skipped.update(nx.descendants(self.plan, node))
+                        else:
+                            self.done.append(node)
+
+                    if not error:
+                        for successor in self.plan.successors(node):
+                            waiting[successor] -= 1
+                            if waiting[successor] == 0:
+                                submit(successor)
+                    if progress:
+                        progress(self)
+
+        self.finished = time.time()
+        return self
+
+    def summary(self):
+        elapsed = (self.finished or time.time()) - (self.started or time.time())
+        parts = [f"Warmed {len(self.done)} of {self.total} nodes in {elapsed:.1f}s"]
+        if self.running:
+            parts.append(f"running {', '.join(sorted(self.running))}")
+        if self.failed:
+            parts.append(f"{len(self.failed)} failed")
+        if self.skipped:
+            parts.append(f"{len(self.skipped)} skipped")
+        return ", ".join(parts) + "."